@@ -1,10 +1,11 @@
 import streamlit as st
 import pymongo
 import certifi
-import random
+import html
 
-from pages.utils.search_button_utils import get_embedding, vector_search
-from functools import partial
+from pages.utils.search_button_utils import warm_up
+from pages.utils.hybrid_search_utils import hybrid_search
+from pages.utils.click_utils import ClickAggregator
 
 # MongoDB connection setup
 ca = certifi.where()
@@ -14,6 +15,56 @@ MONGO_URI = st.secrets["mongo"]["host"]
 def init_connection():
     return pymongo.MongoClient(MONGO_URI, tlsCAFile=ca)
 
+# Shared by every session so clicks are batched across users
+@st.cache_resource
+def get_click_aggregator():
+    return ClickAggregator(init_connection()["Home"]["Home Icons"], on_flush=clear_catalog_cache)
+
+# Catalog reads are cached for a short time; clicks made here are overlaid by the aggregator
+# until they are flushed, which also clears these cached reads
+CATALOG_TTL = 30
+ITEMS_PER_PAGE = 20
+CATALOG_FIELDS = {
+    "_id": 0,
+    "name": 1,
+    "picture_url": 1,
+    "clicks": 1
+}
+
+def get_collection():
+    return init_connection()["Home"]["Home Icons"]
+
+@st.cache_resource
+def ensure_indexes():
+    """Create the indexes behind the top-N query and the batched $inc updates."""
+    collection = get_collection()
+    collection.create_index([("clicks", pymongo.DESCENDING)])
+    collection.create_index("name")
+
+@st.cache_data(ttl=CATALOG_TTL)
+def fetch_top_items(limit=4):
+    """Most clicked items, sorted and limited by the server."""
+    return list(get_collection().find({}, CATALOG_FIELDS).sort("clicks", pymongo.DESCENDING).limit(limit))
+
+@st.cache_data(ttl=CATALOG_TTL)
+def count_items():
+    return get_collection().count_documents({})
+
+@st.cache_data(ttl=CATALOG_TTL)
+def fetch_items_page(page, page_size=ITEMS_PER_PAGE):
+    """One page of the catalog in insertion order."""
+    return list(
+        get_collection().find({}, CATALOG_FIELDS)
+        .sort("_id", pymongo.ASCENDING)
+        .skip(page * page_size)
+        .limit(page_size)
+    )
+
+def clear_catalog_cache():
+    # Cached snapshots predate the flush and would hide the clicks it just wrote
+    fetch_top_items.clear()
+    fetch_items_page.clear()
+
 def config():
     """Configure Streamlit page settings and custom CSS."""
     st.set_page_config(
@@ -53,6 +104,15 @@ def config():
             color: #333; 
             cursor: pointer; 
         }
+        .card-grid {
+            display: grid;
+            grid-template-columns: repeat(4, 1fr);
+            gap: 10px;
+            padding: 20px;
+        }
+        @media (max-width: 900px) {
+            .card-grid { grid-template-columns: repeat(2, 1fr); }
+        }
         .card-clicks {
             font-size: 1em; 
             color: #666;
@@ -102,32 +162,63 @@ def config():
         </style>
     """, unsafe_allow_html=True)
 
-def render_section(title, items, highlight=False):
+def render_card_grid(items, highlight=False):
+    """Build the HTML for a whole grid of cards so it is sent as one element."""
+    card_class = "card highlighted" if highlight else "card"
+    cards = "".join(f"""
+        <div class="{card_class}">
+            <img src="{html.escape(item['picture_url'])}" alt="{html.escape(item['name'])}">
+            <div class="card-name">{html.escape(item['name'])}</div>
+            <div class="card-clicks">Clicks: {item['clicks']}</div>
+        </div>
+    """ for item in items)
+    return f'<div class="card-grid">{cards}</div>'
+
+def select_item(widget_key):
+    item_name = st.session_state[widget_key]
+    if item_name:
+        increment_clicks(item_name)
+        st.session_state[widget_key + "_selected"] = item_name
+        # Clear the selection so the same item can be selected again
+        st.session_state[widget_key] = None
+
+def render_section(title, items, highlight=False, key=None):
     """
     Render a section with a title and grid of styled cards.
+
+    The grid is emitted as a single HTML element and items are selected with
+    one widget whose key is stable across reruns.
     Args:
         title (str): Section title
         items (list): List of dictionaries with card details
         highlight (bool): Whether to apply a highlight style to the cards
+        key (str): Widget key prefix, defaults to one derived from the title
     """
+    widget_key = "select_" + (key or title.lower().replace(" ", "_"))
+
     st.markdown(f'<h2 class="section-title">{title}</h2>', unsafe_allow_html=True)
-    st.markdown('<div class="container">', unsafe_allow_html=True)
-    
-    cols = st.columns(4)  # Four columns for grid layout
-    for idx, item in enumerate(items):
-        with cols[idx % 4]:  # Cycle through columns
-            card_class = "card highlighted" if highlight else "card"
-            st.markdown(f"""
-                <div class="{card_class}">
-                    <img src="{item['picture_url']}" alt="{item['name']}">
-                    <div class="card-name">{item['name']}</div>
-                    <div class="card-clicks">Clicks: {item['clicks']}</div>
-                </div>
-            """, unsafe_allow_html=True)
-
-            # Bind a unique function for each button using partial
-            if st.button("Select", key=f"click_{item['name']} + {str(random.random())}", on_click=partial(increment_clicks, item["name"])):
-                st.success(f"Clicked on {item['name']}!")
+    st.markdown(render_card_grid(items, highlight), unsafe_allow_html=True)
+
+    if items:
+        st.pills(
+            "Select",
+            [item["name"] for item in items],
+            key=widget_key,
+            on_change=select_item,
+            args=(widget_key,)
+        )
+    selected = st.session_state.pop(widget_key + "_selected", None)
+    if selected:
+        st.success(f"Clicked on {selected}!")
+
+# Paging through the catalog only reruns this fragment, not the rest of the page
+@st.fragment
+def render_all_items():
+    total_pages = max(1, -(-count_items() // ITEMS_PER_PAGE))
+    page = st.number_input("Page", min_value=1, max_value=total_pages, value=1, key="all_items_page") - 1
+    items = get_click_aggregator().apply_pending(fetch_items_page(page))
+    render_section("All Items", items)
+    st.caption(f"Page {page + 1} of {total_pages}")
                 
 def click_incrementing(item_name):
     st.session_state["item_name"] = item_name
@@ -137,22 +228,14 @@ def click_incrementing(item_name):
 def increment_clicks(item_name):
     """
     Increment clicks for a specific item.
+
+    The click is buffered by the shared ClickAggregator and written to
+    MongoDB in the next batched flush.
     Args:
-        collection_name (str): Name of the collection
         item_name (str): Name of the item to increment clicks for
     """
     try:
-        client = init_connection()
-        if not client:
-            return
-        
-        db = client["Home"]
-        collection = db["Home Icons"]
-        
-        collection.update_one(
-            {"name": item_name},
-            {"$inc": {"clicks": 1}}
-        )
+        get_click_aggregator().increment(item_name)
     except Exception as e:
         st.error(f"Error incrementing clicks for {item_name}: {e}")
 
@@ -171,34 +254,44 @@ def main():
         searchClicked = st.button("🔎")
 
     if searchClicked:
+        # A new search starts without the confirmation of the previous one
+        st.session_state.pop("search", None)
+        st.session_state.pop("select_search_result_selected", None)
         if search_word == None or search_word == "":
             st.warning("Keyword / Question is not typed")
         else:
-            search_results = vector_search(search_word)
-            render_section("Search Result", search_results)
+            try:
+                st.session_state["search"] = {"query": search_word, "results": hybrid_search(search_word)}
+            except Exception as e:
+                st.error(f"Search is unavailable right now: {e}")
+
+    # Results are kept in session state so selecting one, which reruns the
+    # page without the button pressed, does not hide them
+    search = st.session_state.get("search")
+    if search and search["query"] == search_word:
+        render_section("Search Result", get_click_aggregator().apply_pending(search["results"]))
+    else:
+        st.session_state.pop("select_search_result_selected", None)
             
 
     try:
-        client = init_connection()
-        db = client["Home"]
-        collection = db["Home Icons"]
-        items = list(collection.find({}, {
-            "_id": 0,
-            "name": 1,
-            "picture_url": 1,
-            "clicks": 1
-        }))
-        
-        # Fetch top 4 items with the highest clicks
-        highlighted_items = sorted(items, key=lambda x: x['clicks'], reverse=True)[:4]
+        ensure_indexes()
+        aggregator = get_click_aggregator()
+
+        # Fetch top 4 items with the highest clicks, including clicks not flushed yet
+        highlighted_items = aggregator.apply_pending(fetch_top_items(4))
+        highlighted_items = sorted(highlighted_items, key=lambda x: x['clicks'], reverse=True)
         
         # Render highlighted section
         render_section("Most Popular", highlighted_items, highlight=True)
         
-        # Render all items section
-        render_section("All Items", items)
+        # Render all items section, one page at a time
+        render_all_items()
     except Exception as e:
         st.error(f"Error fetching data: {e}")
 
+    # Load the embedding model once the page has rendered so the first search is warm
+    warm_up()
+
 if __name__ == "__main__":
     main()
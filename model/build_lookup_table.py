@@ -0,0 +1,94 @@
+import argparse
+import hashlib
+import json
+
+import numpy as np
+
+# Input grid offered by the Profile and Journey predictor widgets
+CYLINDERS = np.arange(1, 21)
+ENGINE_SIZE_START = 1.0
+ENGINE_SIZE_STEP = 0.1
+ENGINE_SIZE_COUNT = 71  # 1.0 L to 8.0 L
+
+# Rows evaluated per forward pass, keeps the hidden activations to a few hundred MB
+CHUNK_SIZE = 262144
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def forward(bundle, x):
+    """
+    NumPy forward pass of the EmissionPredictor MLP stored in the bundle.
+
+    Weights are cast exactly as NumpyEmissionPredictor does, so table entries
+    match what the serving model computes for the same input.
+    """
+    for i in (1, 2, 3):
+        weight = np.ascontiguousarray(bundle[f'weight_layer{i}.weight'].T, dtype=np.float64)
+        x = x @ weight + bundle[f'weight_layer{i}.bias'].astype(np.float64)
+        if i < 3:
+            x = np.maximum(x, 0.0)
+    return x
+
+def build_lookup_table(bundle):
+    """
+    Evaluate the model over every input combination the UI can produce.
+
+    Returns:
+        np.ndarray: float64 table of shape (vehicle classes, transmissions,
+        fuel types, cylinders, engine sizes, 2) holding CO2 emissions and fuel
+        consumption, indexed by the bundle's category codes. float64 keeps
+        table answers the same as the model's own float64 output.
+    """
+    # Rounded so grid engine sizes equal the values the widgets send, e.g. 2.4 not 2.4000000000000004
+    engine_sizes = np.round(ENGINE_SIZE_START + ENGINE_SIZE_STEP * np.arange(ENGINE_SIZE_COUNT), 1)
+    axes = {
+        'Vehicle_Class': np.arange(len(bundle['vocab_Vehicle_Class'])),
+        'Transmission': np.arange(len(bundle['vocab_Transmission'])),
+        'Fuel_Type': np.arange(len(bundle['vocab_Fuel_Type'])),
+        'Cylinders': CYLINDERS,
+        'Engine_Size': engine_sizes
+    }
+    shape = tuple(len(values) for values in axes.values())
+
+    # Every grid cell as one feature row, columns in the bundle's feature order
+    grid = np.meshgrid(*axes.values(), indexing='ij')
+    by_column = {column: values.ravel() for column, values in zip(axes, grid)}
+    features = np.column_stack([by_column[column] for column in bundle['feature_columns']])
+    features = (features - bundle['scaler_mean']) / bundle['scaler_scale']
+
+    table = np.empty((len(features), 2), dtype=np.float64)
+    for start in range(0, len(features), CHUNK_SIZE):
+        table[start:start + CHUNK_SIZE] = forward(bundle, features[start:start + CHUNK_SIZE])
+    return table.reshape(shape + (2,))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Precompute emission predictions for every UI input.")
+    parser.add_argument('--bundle', default='emission_bundle.npz', help="Inference bundle from train_model.py")
+    parser.add_argument('--output', default='emission_lookup.npy', help="Table file to write")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    with np.load(args.bundle, allow_pickle=False) as data:
+        bundle = {name: data[name] for name in data.files}
+
+    table = build_lookup_table(bundle)
+    np.save(args.output, table)
+
+    # The metadata ties the table to the exact bundle it was computed from
+    metadata = {
+        'bundle_sha256': file_sha256(args.bundle),
+        'cylinders_start': int(CYLINDERS[0]),
+        'engine_size_start': ENGINE_SIZE_START,
+        'engine_size_step': ENGINE_SIZE_STEP,
+        'shape': list(table.shape)
+    }
+    with open(args.output.rsplit('.', 1)[0] + '.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    print(f"Wrote {table.size // 2} predictions to {args.output} ({table.nbytes / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
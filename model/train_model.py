@@ -1,33 +1,53 @@
+import argparse
+import copy
+import os
+import random
+import time
+
 import torch
 import torch.nn as nn
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
-from torch.utils.data import Dataset, DataLoader
+
+# Bump whenever the layout of the inference bundle changes
+BUNDLE_VERSION = 1
+
+FEATURE_COLUMNS = ['Vehicle_Class', 'Engine_Size', 'Cylinders', 'Transmission', 'Fuel_Type']
+TARGET_COLUMNS = ['CO2_Emissions', 'Fuel_Consumption_Comb']
+CATEGORICAL_COLUMNS = ['Vehicle_Class', 'Transmission', 'Fuel_Type']
 
 # Data preprocessing
 def preprocess_data(data):
-    # Convert categorical variables to numerical
-    data['Vehicle_Class_OLD'] = data['Vehicle_Class']
-    data['Transmission_OLD'] = data['Transmission']
-    data['Fuel_Type_OLD'] = data['Fuel_Type']
-    data['Vehicle_Class'] = pd.Categorical(data['Vehicle_Class']).codes
-    data['Transmission'] = pd.Categorical(data['Transmission']).codes
-    data['Fuel_Type'] = pd.Categorical(data['Fuel_Type']).codes
-    return data
-
-# Custom Dataset class
-class VehicleDataset(Dataset):
-    def __init__(self, X, y):
-        self.X = torch.FloatTensor(X)
-        self.y = torch.FloatTensor(y)
-        
-    def __len__(self):
-        return len(self.X)
-    
-    def __getitem__(self, idx):
-        return self.X[idx], self.y[idx]
+    # Convert categorical variables to numerical, keeping each vocabulary for inference
+    vocabularies = {}
+    for column in CATEGORICAL_COLUMNS:
+        categorical = pd.Categorical(data[column])
+        data[column + '_OLD'] = data[column]
+        data[column] = categorical.codes
+        vocabularies[column] = np.asarray(categorical.categories, dtype=str)
+    return data, vocabularies
+
+def save_bundle(path, model, scaler, vocabularies):
+    """
+    Write everything inference needs into one versioned .npz bundle.
+
+    The bundle holds the layer weights, the fitted scaler statistics and the
+    category vocabularies, in the order the codes were assigned.
+    """
+    arrays = {
+        'version': np.array(BUNDLE_VERSION),
+        'feature_columns': np.asarray(FEATURE_COLUMNS),
+        'target_columns': np.asarray(TARGET_COLUMNS),
+        'scaler_mean': scaler.mean_.astype(np.float64),
+        'scaler_scale': scaler.scale_.astype(np.float64)
+    }
+    for column, vocabulary in vocabularies.items():
+        arrays['vocab_' + column] = vocabulary
+    for name, tensor in model.state_dict().items():
+        arrays['weight_' + name] = tensor.detach().cpu().numpy()
+    np.savez(path, **arrays)
 
 # Neural Network Model
 class EmissionPredictor(nn.Module):
@@ -44,51 +64,192 @@ class EmissionPredictor(nn.Module):
         x = self.layer3(x)
         return x
 
+def export_model(model, input_dim, torchscript_path, onnx_path):
+    """
+    Export the trained model to TorchScript and ONNX for torch-free serving.
+
+    ONNX export needs extra packages on some torch versions, so a failure there
+    is reported and skipped rather than aborting the run.
+    """
+    model.eval()
+    torch.jit.script(model).save(torchscript_path)
+
+    try:
+        torch.onnx.export(
+            model,
+            torch.zeros(1, input_dim),
+            onnx_path,
+            input_names=['features'],
+            output_names=['emissions'],
+            dynamic_axes={'features': {0: 'batch'}, 'emissions': {0: 'batch'}}
+        )
+    except Exception as e:
+        print(f"Skipping ONNX export: {e}")
+
+def set_seed(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    torch.use_deterministic_algorithms(True)
+
+def iterate_minibatches(X, y, batch_size, generator):
+    """Yield shuffled minibatches by slicing whole tensors with a random permutation."""
+    permutation = torch.randperm(len(X), generator=generator)
+    for start in range(0, len(X), batch_size):
+        idx = permutation[start:start + batch_size]
+        yield X[idx], y[idx]
+
+def evaluate(model, X, y):
+    """
+    Compute MSE loss plus per-target MAE and RMSE on a held-out set.
+
+    Returns:
+        dict: loss (float), mae and rmse (arrays ordered like TARGET_COLUMNS).
+    """
+    model.eval()
+    with torch.inference_mode():
+        errors = model(X) - y
+    return {
+        'loss': errors.pow(2).mean().item(),
+        'mae': errors.abs().mean(dim=0).numpy(),
+        'rmse': errors.pow(2).mean(dim=0).sqrt().numpy()
+    }
+
+def build_scheduler(optimizer, schedule, num_epochs):
+    if schedule == 'plateau':
+        return torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, factor=0.5, patience=3)
+    if schedule == 'cosine':
+        return torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=num_epochs)
+    return None
+
 # Training function
-def train_model(model, train_loader, criterion, optimizer, num_epochs):
-    model.train()
+def train_model(model, X_train, y_train, X_val, y_val, criterion, optimizer, num_epochs,
+                batch_size=64, scheduler=None, patience=10, generator=None):
+    """
+    Train with whole-tensor minibatching and early stopping on validation loss.
+
+    The weights from the best validation epoch are restored before returning.
+
+    Returns:
+        list: Per-epoch dicts with train_loss, val_loss, lr and seconds.
+    """
+    best_loss = float('inf')
+    best_state = copy.deepcopy(model.state_dict())
+    epochs_without_improvement = 0
+    history = []
+
     for epoch in range(num_epochs):
-        for X_batch, y_batch in train_loader:
+        started = time.perf_counter()
+        model.train()
+        total_loss = 0.0
+        for X_batch, y_batch in iterate_minibatches(X_train, y_train, batch_size, generator):
             optimizer.zero_grad()
             outputs = model(X_batch)
             loss = criterion(outputs, y_batch)
             loss.backward()
             optimizer.step()
+            total_loss += loss.item() * len(X_batch)
+
+        val_loss = evaluate(model, X_val, y_val)['loss']
+        if isinstance(scheduler, torch.optim.lr_scheduler.ReduceLROnPlateau):
+            scheduler.step(val_loss)
+        elif scheduler is not None:
+            scheduler.step()
+
+        history.append({
+            'epoch': epoch + 1,
+            'train_loss': total_loss / len(X_train),
+            'val_loss': val_loss,
+            'lr': optimizer.param_groups[0]['lr'],
+            'seconds': time.perf_counter() - started
+        })
+        print(f"Epoch {epoch + 1}/{num_epochs} - train loss {history[-1]['train_loss']:.4f}"
+              f" - val loss {val_loss:.4f} - {history[-1]['seconds']:.3f}s")
+
+        if val_loss < best_loss:
+            best_loss = val_loss
+            best_state = copy.deepcopy(model.state_dict())
+            epochs_without_improvement = 0
+        else:
+            epochs_without_improvement += 1
+            if epochs_without_improvement >= patience:
+                print(f"Early stopping after {epoch + 1} epochs")
+                break
+
+    model.load_state_dict(best_state)
+    return history
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the SETTLE emission predictor.")
+    parser.add_argument('--data', default='co2_emission_canada.tsv', help="Training TSV file")
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--lr', type=float, default=0.001)
+    parser.add_argument('--lr-schedule', choices=['none', 'plateau', 'cosine'], default='plateau')
+    parser.add_argument('--patience', type=int, default=10,
+                        help="Epochs without validation improvement before stopping")
+    parser.add_argument('--val-size', type=float, default=0.1,
+                        help="Fraction of the training split held out for validation")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--threads', type=int, default=os.cpu_count(),
+                        help="CPU threads used by torch")
+    return parser.parse_args()
 
 # Main execution
 def main():
+    args = parse_args()
+    set_seed(args.seed)
+    torch.set_num_threads(args.threads)
+
     # Load and preprocess data
-    data = pd.read_csv('co2_emission_canada.tsv', sep='\t')
-    data = preprocess_data(data)
+    data = pd.read_csv(args.data, sep='\t')
+    data, vocabularies = preprocess_data(data)
     
     data.to_csv("pin_pointed.csv")
     
     # Prepare features and targets
-    X = data[['Vehicle_Class', 'Engine_Size', 'Cylinders', 'Transmission', 'Fuel_Type']].values
-    y = data[['CO2_Emissions', 'Fuel_Consumption_Comb']].values
+    X = data[FEATURE_COLUMNS].values
+    y = data[TARGET_COLUMNS].values
     
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    # Split data into train, validation and test
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=args.seed)
+    X_train, X_val, y_train, y_val = train_test_split(
+        X_train, y_train, test_size=args.val_size, random_state=args.seed
+    )
     
     # Scale data
     scaler = StandardScaler()
     X_train = scaler.fit_transform(X_train)
+    X_val = scaler.transform(X_val)
     X_test = scaler.transform(X_test)
-    
-    # Create data loaders
-    train_dataset = VehicleDataset(X_train, y_train)
-    train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True)
+
+    X_train, X_val, X_test = (torch.tensor(a, dtype=torch.float32) for a in (X_train, X_val, X_test))
+    y_train, y_val, y_test = (torch.tensor(a, dtype=torch.float32) for a in (y_train, y_val, y_test))
     
     # Initialize model
     model = EmissionPredictor(input_dim=5)
     criterion = nn.MSELoss()
-    optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
+    optimizer = torch.optim.Adam(model.parameters(), lr=args.lr)
+    scheduler = build_scheduler(optimizer, args.lr_schedule, args.epochs)
+    generator = torch.Generator().manual_seed(args.seed)
     
     # Train model
-    train_model(model, train_loader, criterion, optimizer, num_epochs=100)
+    started = time.perf_counter()
+    history = train_model(
+        model, X_train, y_train, X_val, y_val, criterion, optimizer, args.epochs,
+        batch_size=args.batch_size, scheduler=scheduler, patience=args.patience,
+        generator=generator
+    )
+    print(f"Trained {len(history)} epochs in {time.perf_counter() - started:.2f}s")
+
+    # Report test metrics
+    metrics = evaluate(model, X_test, y_test)
+    for i, column in enumerate(TARGET_COLUMNS):
+        print(f"{column}: MAE {metrics['mae'][i]:.3f}, RMSE {metrics['rmse'][i]:.3f}")
     
-    # Save model
-    torch.save(model.state_dict(), 'emission_predictor.pth')
+    # Save weights, scaler and vocabularies as one inference bundle
+    save_bundle('emission_bundle.npz', model, scaler, vocabularies)
+    export_model(model, 5, 'emission_predictor.pt', 'emission_predictor.onnx')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,49 +1,119 @@
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
+import argparse
+import hashlib
 import os
-from pymongo import MongoClient
+import time
+from pymongo import MongoClient, UpdateOne
 import certifi
 
 MONGODB_URI = ""
 
-ca = certifi.where()
-client = MongoClient(MONGODB_URI, tlsCAFile=ca)
+EMBEDDING_MODEL = "thenlper/gte-small"
 
-db = client["Home"]
-collection = db["Home Icons"]
+# Documents read from the cursor per chunk, and texts per encode() batch
+CHUNK_SIZE = 256
+ENCODE_BATCH_SIZE = 64
 
-all_items = list(collection.find({}, {
-    "_id": 0,
-    "name": 1,
-    "picture_url": 1,
-    "clicks": 1,
-    "description": 1
-}))
+def get_collection(uri):
+    """
+    Connect to the "Home Icons" collection.
+
+    A "mongomock://" URI runs against an in-memory mongomock client, which is
+    useful for trying the pipeline without a database.
+    """
+    if uri.startswith("mongomock://"):
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        client = MongoClient(uri, tlsCAFile=certifi.where())
+    return client["Home"]["Home Icons"]
+
+def description_hash(text):
+    """Hash of the embedded text and model, so a change to either triggers a re-embed."""
+    return hashlib.sha256(f"{EMBEDDING_MODEL}\n{text}".encode("utf-8")).hexdigest()
 
-embedding_model = SentenceTransformer("thenlper/gte-small")
+def iter_chunks(collection, chunk_size=CHUNK_SIZE):
+    """Stream documents from a cursor in lists of at most `chunk_size`."""
+    cursor = collection.find(
+        {},
+        {"_id": 1, "description": 1, "description_hash": 1}
+    ).batch_size(chunk_size)
 
-def get_embedding(text):
+    chunk = []
+    for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def ingest_embeddings(collection, embedding_model, chunk_size=CHUNK_SIZE, batch_size=ENCODE_BATCH_SIZE):
     """
-    Generate the embedding for a piece of text.
+    Embed every document's description and write the embeddings back in place.
 
-    Args:
-        text (str): Text to embed.
+    Documents whose description hash is unchanged are skipped. Each chunk is
+    encoded in batches and written with one unordered bulk_write of UpdateOne
+    operations that only set the embedding fields, so the collection is never
+    emptied or rewritten mid-run.
 
     Returns:
-        List[float]: Embedding of the text as a list.
+        dict: Counts of scanned, embedded and skipped documents.
     """
-    embedding = embedding_model.encode(text)
+    stats = {"scanned": 0, "embedded": 0, "skipped": 0}
+    total = collection.estimated_document_count()
+
+    with tqdm(total=total) as progress:
+        for chunk in iter_chunks(collection, chunk_size):
+            stats["scanned"] += len(chunk)
+            progress.update(len(chunk))
+
+            stale = []
+            for doc in chunk:
+                if not doc.get("description"):
+                    continue
+                digest = description_hash(doc["description"])
+                if doc.get("description_hash") != digest:
+                    stale.append((doc, digest))
+            stats["skipped"] += len(chunk) - len(stale)
+            if not stale:
+                continue
+
+            embeddings = embedding_model.encode(
+                [doc["description"] for doc, _ in stale],
+                batch_size=batch_size
+            )
+            collection.bulk_write([
+                UpdateOne(
+                    {"_id": doc["_id"]},
+                    {"$set": {"embedding": embedding.tolist(), "description_hash": digest}}
+                )
+                for (doc, digest), embedding in zip(stale, embeddings)
+            ], ordered=False)
+            stats["embedded"] += len(stale)
 
-    return embedding.tolist()
+    return stats
 
+def main():
+    parser = argparse.ArgumentParser(description="Embed Home Icons descriptions into MongoDB.")
+    parser.add_argument("--uri", default=os.environ.get("MONGODB_URI", MONGODB_URI),
+                        help='MongoDB URI, or "mongomock://" for an in-memory database')
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE)
+    args = parser.parse_args()
 
-embedded_docs = []
-for doc in tqdm(all_items):
-    doc["embedding"] = get_embedding(doc["description"])
+    collection = get_collection(args.uri)
+    embedding_model = SentenceTransformer(EMBEDDING_MODEL)
 
-    embedded_docs.append(doc)
+    started = time.perf_counter()
+    stats = ingest_embeddings(collection, embedding_model, args.chunk_size, args.batch_size)
+    elapsed = time.perf_counter() - started
 
-collection.delete_many({})
-collection.insert_many(embedded_docs)
+    print(f"Scanned {stats['scanned']} documents, embedded {stats['embedded']}, "
+          f"skipped {stats['skipped']} unchanged in {elapsed:.2f}s "
+          f"({stats['scanned'] / elapsed if elapsed else 0:.1f} docs/s)")
+    print("Data ingestion into MongoDB completed")
 
-print("Data ingestion into MongoDB completed")
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,8 @@ import os
 import requests
 import polyline
 import pandas as pd
-import torch
 
-from pages.utils.custom_model_utils import preprocess_input, load_model
+from pages.utils.custom_model_utils import predict
 
 dirname = os.path.dirname(__file__)
 
@@ -152,19 +151,14 @@ def predictor(car_brand, car_model):
         
         
     if st.button("Predict"):
-        # Preprocess input
-        input_data = preprocess_input(vehicle_class, engine_size, cylinders, transmission, fuel_type)
-        
         # Make prediction
-        model = load_model()
-        with torch.no_grad():
-            prediction = model(torch.FloatTensor(input_data))
+        co2_emission, fuel_consumption = predict(vehicle_class, engine_size, cylinders, transmission, fuel_type)
         # Display results
-        st.write('Predicted CO2 Emissions (g/km):', prediction[0][0].item())
-        st.write('Predicted Fuel Consumption (L/100 km):', prediction[0][1].item())
+        st.write('Predicted CO2 Emissions (g/km):', co2_emission)
+        st.write('Predicted Fuel Consumption (L/100 km):', fuel_consumption)
         
-        st.session_state["co2_emission"] = prediction[0][0].item()
-        st.session_state["fuel_consumption"] = prediction[0][1].item()
+        st.session_state["co2_emission"] = co2_emission
+        st.session_state["fuel_consumption"] = fuel_consumption
     
     
     if 'co2_emission' in st.session_state and 'fuel_consumption' in st.session_state:
@@ -1,21 +1,49 @@
 import streamlit as st
+import streamlit.components.v1 as components
 from streamlit_folium import st_folium
 import folium
-from folium.plugins import MarkerCluster
+from folium.plugins import MarkerCluster, FastMarkerCluster
+from folium.utilities import image_to_url
+import pydeck as pdk
 
 import os
+import time
 import requests
-import polyline
 import pandas as pd
-import torch
 
-from pages.utils.google_map_utils import get_route, get_petronas_stations_along_route
-from pages.utils.custom_model_utils import preprocess_input, load_model
-from pages.utils.text_gen_utils import generate_answer
+from pages.utils.google_map_utils import (
+    get_route, get_petronas_stations_along_routes,
+    route_cache_key, route_result_cache, place_details_cache, geocode_cache, directions_cache
+)
+from pages.utils.route_utils import decode_alternatives
+from pages.utils.route_comparison_utils import FUEL_PRICE, OBJECTIVES, compare_routes, best_route
+from pages.utils.custom_model_utils import predict
+from pages.utils.text_gen_utils import (
+    generate_answer, format_coordinate, split_cached_summaries, iter_review_summaries, get_completion_stats
+)
 
 
 dirname = os.path.dirname(__file__)
 
+MAP_HEIGHT = 700
+
+FOLIUM_RENDERER = "Folium"
+DECK_RENDERER = "Deck.gl"
+MAP_RENDERERS = [FOLIUM_RENDERER, DECK_RENDERER]
+
+# The route line is simplified to stay within a pixel of the full geometry at this zoom
+ROUTE_DETAIL_ZOOM = 15
+
+# Rows are [lat, lng, popup html]; the icon is created once and shared by every marker
+STATION_MARKER_CALLBACK = """(function () {
+    var icon = L.icon({iconUrl: "%s", iconSize: [50, 50]});
+    return function (row) {
+        var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+        marker.bindPopup(row[2], {maxWidth: 350});
+        return marker;
+    };
+})()"""
+
 def config():
     """Configure Streamlit page settings and custom CSS"""
     st.set_page_config(
@@ -63,52 +91,245 @@ def render_route_planner():
     
     # Search radius
     radius = st.slider("Search radius for stations (meters)", 500, 10000, 3000, 500)
+    refresh_stations = st.checkbox("Refresh stations from Google Maps", value=False)
     
+    key = route_cache_key(origin, destination, radius)
     if st.button("Plan Route"):
         with st.spinner('Planning route and finding stations...'):
-            # Get route
-            route = get_route(origin, destination)
-            
-            if route:
-                # Get stations along route
-                df = get_petronas_stations_along_route(route, radius)
-                
-                # Create tabs
-                tab1, tab2, tab3 = st.tabs(["Map View", "Station List", "Route Details"])
-                
-                with tab1:
-                    create_route_map(df, route)
-  
-                
-                with tab2:
-                    st.subheader("Stations Along Route")
-                    display_df = df.drop(columns=['Reviews', 'Place ID'])
-                    st.dataframe(display_df, hide_index=True)
-                
-                with tab3:
-                    st.subheader("Route Information")
-                    route_info = route[0]['legs'][0]
-                    st.write(f"Distance: {route_info['distance']['text']}")
-                    st.write(f"Duration: {route_info['duration']['text']}")
-                    st.write(f"Number of stations found: {len(df)}")
-                    
-                    with st.container(border=True):
-                        predictor(int(route_info['distance']['text'].split()[0]), route)
-
-
-def create_route_map(df, route):
+            result = None
+            if not refresh_stations:
+                started = time.perf_counter()
+                cached = route_result_cache.get(key)
+                if cached is not None:
+                    result = restore_route_result(cached)
+                    result["timings"]["Route cache lookup"] = time.perf_counter() - started
+            if result is None:
+                result = plan_route(origin, destination, radius, refresh_stations)
+        st.session_state["route_result"] = dict(result, key=key) if result else None
+
+    # Results live in session state, so changing a widget below does not replan the route
+    result = st.session_state.get("route_result")
+    if result and result["key"] == key:
+        render_route_result(result)
+
+def plan_route(origin, destination, radius, refresh_stations=False):
+    """
+    Fetch directions and the stations along every alternative route, timing each stage.
+
+    The first alternative, Google's recommended route, is selected.
+
+    Returns:
+        dict: directions, decoded alternatives and their stations, the selected
+        route and its stations, and timings, or None if no route was found.
+    """
+    timings = {}
+    started = time.perf_counter()
+    directions = get_route(origin, destination)
+    timings["Directions"] = time.perf_counter() - started
+    if not directions:
+        return None
+
+    started = time.perf_counter()
+    routes = decode_alternatives(directions)
+    timings["Decode routes"] = time.perf_counter() - started
+
+    # Places is only searched where the local index has not searched before,
+    # unless a refresh is requested
+    started = time.perf_counter()
+    stations_by_route = get_petronas_stations_along_routes(routes, radius, refresh=refresh_stations)
+    timings["Stations"] = time.perf_counter() - started
+
+    result = {
+        "directions": directions, "routes": routes, "stations_by_route": stations_by_route,
+        "map_html": None, "source": "Google Maps", "timings": timings
+    }
+    select_alternative(result, 0)
+    return result
+
+def select_alternative(result, i):
+    """Make alternative `i` the route shown on the map and in the route details."""
+    result.update(
+        selected=i, route=result["routes"][i], stations=result["stations_by_route"][i],
+        summaries=None, map_html=None
+    )
+
+def store_route_result(result):
+    """
+    Share a planned route with other sessions through the route result cache.
+
+    Only plain data is stored, so cached entries do not depend on the classes
+    the page builds from them.
+    """
+    route_result_cache.set(result["key"], {
+        "directions": result["directions"],
+        "stations_by_route": [df.to_dict("split") for df in result["stations_by_route"]],
+        "selected": result["selected"],
+        "summaries": result["summaries"]
+    })
+
+def restore_route_result(cached):
+    """Rebuild a planned route from an entry written by `store_route_result`."""
+    result = {
+        "directions": cached["directions"],
+        "routes": decode_alternatives(cached["directions"]),
+        "stations_by_route": [pd.DataFrame(**split) for split in cached["stations_by_route"]],
+        "source": "shared route cache", "timings": {}
+    }
+    select_alternative(result, cached["selected"])
+    result["summaries"] = cached["summaries"]
+    return result
+
+def render_route_result(result):
+    """Render the map, station list and route details of a planned route."""
+    route, df = result["route"], result["stations"]
+
+    # Create tabs
+    tab1, tab2, tab3, tab4 = st.tabs(["Map View", "Station List", "Route Details", "Compare Routes"])
+    
+    with tab1:
+        renderer = st.radio("Map renderer", MAP_RENDERERS, horizontal=True, key="map_renderer")
+        if result.get("summaries") is None:
+            summaries, complete = create_route_map(df, route, result["timings"], renderer)
+            result["summaries"] = summaries
+            if complete:
+                store_route_result(result)
+        elif renderer == DECK_RENDERER:
+            st.pydeck_chart(build_route_deck(df, route, result["summaries"]), height=MAP_HEIGHT)
+        else:
+            # The rendered HTML is kept in session state so reruns skip building the map
+            if result.get("map_html") is None:
+                result["map_html"] = build_route_map(df, route, result["summaries"]).get_root().render()
+            components.html(result["map_html"], height=MAP_HEIGHT)
+
+    with tab2:
+        st.subheader("Stations Along Route")
+        display_df = df.drop(columns=['Reviews', 'Place ID'])
+        st.dataframe(display_df, hide_index=True)
+    
+    with tab3:
+        st.subheader("Route Information")
+        st.write(f"Distance: {route.distance_text}")
+        st.write(f"Duration: {route.duration_text}")
+        st.write(f"Number of stations found: {len(df)}")
+        
+        with st.container(border=True):
+            predictor(route.distance_km, route)
+
+    with tab4:
+        render_route_comparison(result)
+
+    with st.expander("Debug: timings and caches"):
+        st.write(f"Route result served from {result['source']}")
+        st.dataframe(pd.DataFrame({
+            "Stage": list(result["timings"]),
+            "Seconds": [round(seconds, 3) for seconds in result["timings"].values()]
+        }), hide_index=True)
+        st.json({
+            "route_results": route_result_cache.stats(),
+            "geocode": geocode_cache.stats(),
+            "directions": directions_cache.stats(),
+            "place_details": place_details_cache.stats(),
+            "completions": get_completion_stats()
+        })
+    result["source"] = "session state"
+
+def render_route_comparison(result):
+    """Compare every alternative route for the vehicle chosen in the route details."""
+    st.subheader("Alternative Routes")
+    comparison = compare_routes(
+        result["routes"],
+        st.session_state["co2_emission"],
+        st.session_state["fuel_consumption"],
+        [len(df) for df in result["stations_by_route"]]
+    )
+    st.dataframe(comparison.round(2), hide_index=True)
+
+    objective = st.radio("Prefer", list(OBJECTIVES), horizontal=True, key="route_objective")
+    best = best_route(comparison, objective)
+    st.write(f"{objective} route: **{comparison['Route'][best]}**")
+    if best == result["selected"]:
+        st.caption("This is the route shown on the map")
+    else:
+        st.button("Show this route", on_click=select_alternative, args=(result, best))
+
+def show_route_map(df, route, summaries, pending_ids=(), renderer=FOLIUM_RENDERER, key=None):
+    if renderer == DECK_RENDERER:
+        st.pydeck_chart(build_route_deck(df, route, summaries, pending_ids), height=MAP_HEIGHT)
+    else:
+        st_folium(build_route_map(df, route, summaries, pending_ids), width=1200, height=MAP_HEIGHT, returned_objects=[], key=key)
+
+def create_route_map(df, route, timings, renderer=FOLIUM_RENDERER):
+    """
+    Show the route map straight away and fill in review summaries as they arrive.
+
+    Markers are drawn with whatever summaries are already cached; the rest are
+    generated concurrently, listed as they complete, and the map is redrawn
+    once they are all in.
+
+    Returns:
+        tuple: Review summaries by place ID, and whether every summary was generated.
+    """
+    started = time.perf_counter()
+    summaries, pending = split_cached_summaries(df)
+    pending_ids = {place_id for place_id, _, _ in pending}
+
+    map_placeholder = st.empty()
+    with map_placeholder:
+        show_route_map(df, route, summaries, pending_ids, renderer, key="route_map_preview")
+    first_paint = time.perf_counter() - started
+    timings["Map first paint"] = first_paint
+
+    failed = 0
+    if pending:
+        names = dict(zip(df['Place ID'], df['Station Name']))
+        with st.status(f"Summarizing reviews for {len(pending)} stations...") as status:
+            for place_id, summary, error in iter_review_summaries(pending):
+                if error is not None:
+                    failed += 1
+                    continue
+                summaries[place_id] = summary
+                st.markdown(f"**{names[place_id]}:** {summary}")
+            status.update(label="Review summaries ready", state="complete", expanded=False)
+        if failed:
+            st.warning(f"Could not summarize reviews for {failed} stations")
+
+        with map_placeholder:
+            show_route_map(df, route, summaries, renderer=renderer, key="route_map")
+
+    complete = time.perf_counter() - started
+    timings["Review summaries"] = complete - first_paint
+    st.caption(f"Map shown after {first_paint:.2f}s, review summaries complete after {complete:.2f}s")
+    return summaries, not failed
+
+@st.cache_data
+def get_station_icon_url():
+    return image_to_url(dirname + "/img/petronas.webp")
+
+def station_popup_html(row, summaries, pending_ids=()):
+    reviews_html = ""
+    if row['Place ID'] in summaries:
+        reviews_html = "<br><br><b>Summarized Reviews:</b><br>" + summaries[row['Place ID']]
+    elif row['Place ID'] in pending_ids:
+        reviews_html = "<br><br><i>Summarizing reviews...</i>"
+
+    return f"""
+        <div style='width: 300px'>
+            <h4>{row['Station Name']}</h4>
+            <b>Address:</b> {row['Address']}<br>
+            <b>Rating:</b> {'⭐' * int(row['Rating']) if isinstance(row['Rating'], (int, float)) else 'No rating'} 
+            ({row['Rating']} from {row['Total Ratings']} reviews)
+            {reviews_html}
+        </div>
+    """
+
+def build_route_map(df, route, summaries, pending_ids=()):
     # Create map centered on route start
-    start_location = route[0]['legs'][0]['start_location']
+    start_location = route.start_location
     m = folium.Map(location=[start_location['lat'], start_location['lng']], zoom_start=10)
     
-    # Draw the route
-    route_coordinates = []
-    for step in route[0]['legs'][0]['steps']:
-        points = polyline.decode(step['polyline']['points'])
-        route_coordinates.extend(points)
-    
+    # Draw the route, simplified to what is visible at street level
     folium.PolyLine(
-        route_coordinates,
+        route.simplified(ROUTE_DETAIL_ZOOM).tolist(),
         weight=4,
         color='blue',
         opacity=0.8
@@ -124,39 +345,22 @@ def create_route_map(df, route):
         icon=folium.Icon(color='blue', icon='info-sign')
     ).add_to(markercluster)
     
-    end_location = route[0]['legs'][0]['end_location']
+    end_location = route.end_location
     folium.Marker(
         [end_location['lat'], end_location['lng']],
         popup='Destination',
         icon=folium.Icon(color='blue', icon='info-sign')
     ).add_to(markercluster)
     
-    
-    markercluster1 = MarkerCluster().add_to(m)
-    for idx, row in df.iterrows():
-        petronas_pin = folium.CustomIcon(icon_image= dirname + "/img/petronas.webp", icon_size=(50, 50))
-        summarized_reviews = generate_answer("Summarize the following reviews in one paragraph in 100 words max plain text:\n" + '\n'.join(
-            [f"{key}: {val}" for doc in row['Reviews'][:3] for key, val in doc.items()]
-        ))
-        reviews_html = ""
-        if len(row['Reviews']) > 0:
-            reviews_html = "<br><br><b>Summarized Reviews:</b><br>" + summarized_reviews
-
-        popup_html = f"""
-            <div style='width: 300px'>
-                <h4>{row['Station Name']}</h4>
-                <b>Address:</b> {row['Address']}<br>
-                <b>Rating:</b> {'⭐' * int(row['Rating']) if isinstance(row['Rating'], (int, float)) else 'No rating'} 
-                ({row['Rating']} from {row['Total Ratings']} reviews)
-                {reviews_html}
-            </div>
-        """
-        
-        folium.Marker(
-            location=[row['Latitude'], row['Longitude']],
-            popup=folium.Popup(popup_html, max_width=350),
-            icon=petronas_pin
-        ).add_to(markercluster1)
+    # Stations are created in the browser from plain rows and share one icon,
+    # instead of embedding the icon image in every marker
+    FastMarkerCluster(
+        [
+            [row['Latitude'], row['Longitude'], station_popup_html(row, summaries, pending_ids)]
+            for _, row in df.iterrows()
+        ],
+        callback=STATION_MARKER_CALLBACK % get_station_icon_url()
+    ).add_to(m)
         
     folium.plugins.Fullscreen(
         position="topright",
@@ -165,8 +369,34 @@ def create_route_map(df, route):
         force_separate_button=True,
     ).add_to(m)
     
-    
-    st_folium(m, width=1200, returned_objects=[])
+    return m
+
+def build_route_deck(df, route, summaries, pending_ids=()):
+    """Build the route map as deck.gl layers, a lighter alternative to the folium map."""
+    path = pdk.Layer(
+        "PathLayer",
+        [{"path": route.simplified(ROUTE_DETAIL_ZOOM)[:, ::-1].tolist()}],
+        get_path="path",
+        get_color=[0, 0, 255],
+        width_min_pixels=4
+    )
+    stations = pd.DataFrame({
+        "lng": df['Longitude'],
+        "lat": df['Latitude'],
+        "popup": [station_popup_html(row, summaries, pending_ids) for _, row in df.iterrows()]
+    }) if not df.empty else pd.DataFrame(columns=["lng", "lat", "popup"])
+    markers = pdk.Layer(
+        "ScatterplotLayer",
+        stations,
+        get_position=["lng", "lat"],
+        get_fill_color=[0, 161, 156],
+        get_radius=300,
+        radius_min_pixels=6,
+        pickable=True
+    )
+    start_location = route.start_location
+    view = pdk.ViewState(latitude=start_location['lat'], longitude=start_location['lng'], zoom=9)
+    return pdk.Deck(layers=[path, markers], initial_view_state=view, tooltip={"html": "{popup}"})
 
 def predictor(length, route):
     vehicle_class = st.selectbox('Vehicle Class', [
@@ -225,22 +455,17 @@ def predictor(length, route):
         'E',
         'N',
     ])
-    # Preprocess input
-    input_data = preprocess_input(vehicle_class, engine_size, cylinders, transmission, fuel_type)
-    
     # Make prediction
-    model = load_model()
-    with torch.no_grad():
-        prediction = model(torch.FloatTensor(input_data))
+    co2_emission, fuel_consumption = predict(vehicle_class, engine_size, cylinders, transmission, fuel_type)
     # Display results
-    st.write('Predicted CO2 Emissions (g/km):', prediction[0][0].item())
-    st.write('Predicted Fuel Consumption (L/100 km):', prediction[0][1].item())
+    st.write('Predicted CO2 Emissions (g/km):', co2_emission)
+    st.write('Predicted Fuel Consumption (L/100 km):', fuel_consumption)
     
-    st.session_state["co2_emission"] = prediction[0][0].item()
-    st.session_state["fuel_consumption"] = prediction[0][1].item()
+    st.session_state["co2_emission"] = co2_emission
+    st.session_state["fuel_consumption"] = fuel_consumption
 
     # Predicted Monthly Fuel Cost (Dynamic)
-    predicted_fuel_cost = length * st.session_state["fuel_consumption"]  * 3.19 / 100
+    predicted_fuel_cost = length * st.session_state["fuel_consumption"]  * FUEL_PRICE / 100
 
     
     # CO2 Emissions (Dynamic)
@@ -260,8 +485,8 @@ def predictor(length, route):
                 <p>Estimated based on mileage</p>
         """, unsafe_allow_html=True)
     
-    end_location = route[0]['legs'][0]['end_location']
-    parking_rate = generate_answer("Estimate roughly the Parking rate in  MYR currency for destination longitude " + str(end_location['lng'])  + " , latitude " + str(end_location['lat']) + "\nDisplay the result in plain text with no futher explaination")
+    end_location = route.end_location
+    parking_rate = generate_answer("Estimate roughly the Parking rate in  MYR currency for destination longitude " + format_coordinate(end_location['lng'])  + " , latitude " + format_coordinate(end_location['lat']) + "\nDisplay the result in plain text with no futher explaination")
     st.write('Predicted Destination Parking Rate:', parking_rate)
     
 
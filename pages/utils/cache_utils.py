@@ -0,0 +1,149 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+dirname = os.path.dirname(__file__)
+
+CACHE_PATH = os.path.join(dirname, '..', 'data', 'cache.sqlite')
+
+class SQLiteCache:
+    """
+    Persistent key/value cache backed by a SQLite file.
+
+    The file is shared by every Streamlit session and process that opens the
+    same path. Entries expire after `ttl` seconds and the least recently used
+    ones are evicted once a namespace holds more than `max_entries`.
+
+    Args:
+        namespace (str): Logical table partition, e.g. "place_details".
+        ttl (float): Seconds an entry stays valid, or None to never expire.
+        max_entries (int): LRU size limit for the namespace, or None for no limit.
+        path (str): SQLite file location.
+    """
+
+    def __init__(self, namespace, ttl=None, max_entries=None, path=CACHE_PATH):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = os.path.abspath(path)
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self._connection().execute(
+            "CREATE INDEX IF NOT EXISTS cache_lru ON cache (namespace, last_access)"
+        )
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads, keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key, default=None):
+        """Return the cached value for `key`, or `default` if missing or expired."""
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+            (self.namespace, key)
+        ).fetchone()
+
+        if row is None:
+            self._count(False)
+            return default
+
+        value, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            )
+            self._count(False)
+            return default
+
+        conn.execute(
+            "UPDATE cache SET last_access = ? WHERE namespace = ? AND key = ?",
+            (now, self.namespace, key)
+        )
+        self._count(True)
+        return pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        """Store `value` under `key`, overriding the namespace TTL if `ttl` is given."""
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl is not None else None
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, pickle.dumps(value), expires_at, now)
+        )
+        if self.max_entries is not None:
+            conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache WHERE namespace = ? "
+                "ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_entries)
+            )
+
+    def get_or_set(self, key, fn, ttl=None):
+        """Return the cached value for `key`, computing and storing it with `fn()` on a miss."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = fn()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        self._connection().execute(
+            "DELETE FROM cache WHERE namespace = ? AND key = ?",
+            (self.namespace, key)
+        )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+    def stats(self):
+        """Return hit/miss counters for this process along with the current entry count."""
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+            'entries': len(self)
+        }
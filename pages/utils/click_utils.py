@@ -0,0 +1,132 @@
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Seconds between background flushes, and pending clicks that trigger an early flush
+FLUSH_INTERVAL = 5.0
+FLUSH_THRESHOLD = 50
+
+logger = logging.getLogger(__name__)
+
+class ClickAggregator:
+    """
+    Write-behind click counter.
+
+    Clicks are accumulated in memory and written to MongoDB as one unordered
+    bulk_write of $inc operations, either every `flush_interval` seconds,
+    once `flush_threshold` clicks are pending, or at interpreter shutdown.
+    Deltas from a failed flush are kept and retried on the next one.
+
+    Args:
+        collection: pymongo collection holding items with "name" and "clicks".
+        flush_interval (float): Seconds between background flushes.
+        flush_threshold (int): Pending clicks that wake the flusher early.
+        on_flush (callable): Called after deltas are persisted, e.g. to drop
+            cached reads that do not include them yet.
+    """
+
+    def __init__(self, collection, flush_interval=FLUSH_INTERVAL, flush_threshold=FLUSH_THRESHOLD, on_flush=None):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.on_flush = on_flush
+        self.writes = 0
+
+        self._pending = Counter()
+        self._flushing = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+        self._thread = threading.Thread(target=self._run, name="click-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # A dead flusher would leave clicks piling up in memory; try again next interval
+                logger.exception("Click flush failed")
+
+    def increment(self, item_name, amount=1):
+        with self._lock:
+            self._pending[item_name] += amount
+            pending_total = sum(self._pending.values())
+        if pending_total >= self.flush_threshold:
+            self._wake.set()
+
+    def pending(self):
+        """Clicks not yet persisted, including those in a flush that is still running."""
+        with self._lock:
+            return self._pending + self._flushing
+
+    def apply_pending(self, items):
+        """Return copies of `items` with their locally pending clicks added."""
+        pending = self.pending()
+        if not pending:
+            return items
+        return [
+            dict(item, clicks=item.get("clicks", 0) + pending[item["name"]])
+            if item.get("name") in pending else item
+            for item in items
+        ]
+
+    def flush(self):
+        """Write all pending deltas in one bulk_write; returns the number of items updated."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._flushing, self._pending = self._pending, Counter()
+
+            deltas = list(self._flushing.items())
+            try:
+                self.collection.bulk_write([
+                    UpdateOne({"name": name}, {"$inc": {"clicks": delta}})
+                    for name, delta in deltas
+                ], ordered=False)
+            except BulkWriteError as e:
+                # Unordered writes may partly succeed; only retry the ones that failed
+                failed = Counter(dict(deltas[error["index"]] for error in e.details.get("writeErrors", [])))
+                with self._lock:
+                    self._pending.update(failed)
+                    self._flushing = Counter()
+                self.writes += 1
+                self._flushed()
+                return len(deltas) - len(failed)
+            except Exception:
+                # Keep the deltas so the next flush retries them
+                with self._lock:
+                    self._pending.update(self._flushing)
+                    self._flushing = Counter()
+                return 0
+
+            with self._lock:
+                flushed, self._flushing = len(self._flushing), Counter()
+            self.writes += 1
+            self._flushed()
+            return flushed
+
+    def _flushed(self):
+        if self.on_flush is None:
+            return
+        try:
+            self.on_flush()
+        except Exception:
+            # The deltas are already persisted, so a failing hook must not undo the flush
+            logger.exception("on_flush callback failed")
+
+    def close(self):
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout=self.flush_interval)
+        self.flush()
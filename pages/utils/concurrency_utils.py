@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+def iter_concurrently(fn, args_list, max_workers=8):
+    """
+    Run `fn` over every argument tuple in `args_list` on a bounded thread pool,
+    yielding each outcome as soon as it completes.
+
+    Workers must not touch Streamlit elements; the caller consumes the
+    generator on the script thread and can update the page as results arrive.
+
+    Args:
+        fn (callable): Function to call, usually a thin wrapper around a remote API call.
+        args_list (list): One tuple of positional arguments per call.
+        max_workers (int): Maximum number of requests in flight at once.
+
+    Yields:
+        tuple: (i, result, error) for args_list[i], with exactly one of
+        result or error set.
+    """
+    if not args_list:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(args_list)))) as executor:
+        futures = {executor.submit(fn, *args): i for i, args in enumerate(args_list)}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+def fetch_concurrently(fn, args_list, max_workers=8):
+    """
+    Run `fn` over every argument tuple in `args_list` on a bounded thread pool.
+
+    Failures are collected and returned to the caller instead of being
+    reported from the worker thread.
+
+    Returns:
+        tuple: (results, errors) where results[i] is the return value for
+        args_list[i] (None on failure) and errors maps indexes to exceptions.
+    """
+    results = [None] * len(args_list)
+    errors = {}
+    for i, result, error in iter_concurrently(fn, args_list, max_workers):
+        if error is not None:
+            errors[i] = error
+        else:
+            results[i] = result
+    return results, errors
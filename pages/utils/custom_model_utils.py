@@ -1,111 +1,247 @@
 import streamlit as st
-import torch
-import torch.nn as nn
 import pandas as pd
 import numpy as np
+import hashlib
+import json
 import os
-from sklearn.preprocessing import StandardScaler
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
 
 dirname = os.path.dirname(__file__)
 
-# Neural Network Model
-class EmissionPredictor(nn.Module):
-    def __init__(self, input_dim):
-        super(EmissionPredictor, self).__init__()
-        self.layer1 = nn.Linear(input_dim, 64)
-        self.layer2 = nn.Linear(64, 32)
-        self.layer3 = nn.Linear(32, 2)  # 2 outputs: CO2 emissions and fuel consumption
-        self.relu = nn.ReLU()
-        
-    def forward(self, x):
-        x = self.relu(self.layer1(x))
-        x = self.relu(self.layer2(x))
-        x = self.layer3(x)
-        return x
+BUNDLE_PATH = dirname + '/models/emission_bundle.npz'
+BUNDLE_VERSION = 1
+
+# Rows per forward pass when scoring large tables
+PREDICT_CHUNK_SIZE = 4096
+
+# "numpy" runs the forward pass in NumPy; "onnx" uses onnxruntime when it is
+# installed and an exported model exists, falling back to NumPy otherwise
+INFERENCE_RUNTIME = "numpy"
+ONNX_PATH = dirname + '/models/emission_predictor.onnx'
+
+# Precomputed predictions for every widget input, built by model/build_lookup_table.py
+LOOKUP_PATH = dirname + '/models/emission_lookup.npy'
+LOOKUP_METADATA_PATH = dirname + '/models/emission_lookup.json'
+
+class NumpyEmissionPredictor:
+    """NumPy forward pass of the 5 -> 64 -> 32 -> 2 EmissionPredictor MLP."""
+
+    def __init__(self, weights):
+        # Store transposed, contiguous weights so each layer is a single matmul
+        self.layers = [
+            (
+                np.ascontiguousarray(weights[f'layer{i}.weight'].T, dtype=np.float64),
+                weights[f'layer{i}.bias'].astype(np.float64)
+            )
+            for i in (1, 2, 3)
+        ]
+
+    def __call__(self, x):
+        for weight, bias in self.layers[:-1]:
+            x = np.maximum(x @ weight + bias, 0.0)
+        weight, bias = self.layers[-1]
+        return x @ weight + bias
+
+class OnnxEmissionPredictor:
+    """onnxruntime session over the ONNX export written by model/train_model.py."""
+
+    def __init__(self, path):
+        self.session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        outputs = self.session.run(None, {self.input_name: x.astype(np.float32)})
+        return outputs[0].astype(np.float64)
+
+# Load the inference bundle written by model/train_model.py once per process
+@st.cache_resource
+def load_bundle(path=BUNDLE_PATH):
+    """
+    Load the versioned inference bundle.
+
+    Returns:
+        dict: Layer weights, scaler mean/scale arrays and the category
+        vocabularies keyed by feature column.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        version = int(data['version'])
+        if version != BUNDLE_VERSION:
+            raise ValueError(f"Unsupported emission bundle version {version}, expected {BUNDLE_VERSION}")
+
+        return {
+            'version': version,
+            'feature_columns': data['feature_columns'].tolist(),
+            'target_columns': data['target_columns'].tolist(),
+            'scaler_mean': data['scaler_mean'],
+            'scaler_scale': data['scaler_scale'],
+            'vocabularies': {
+                name[len('vocab_'):]: data[name] for name in data.files if name.startswith('vocab_')
+            },
+            'weights': {
+                name[len('weight_'):]: data[name] for name in data.files if name.startswith('weight_')
+            }
+        }
+
+def encode_features(vehicles, bundle=None):
+    """
+    Encode a vehicle table into the model's raw numeric feature matrix.
+
+    Args:
+        vehicles (pd.DataFrame): Table with the bundle's feature columns.
+        bundle (dict): Inference bundle, defaults to the shared one.
+
+    Returns:
+        np.ndarray: (N, 5) float64 array in feature column order.
+    """
+    bundle = bundle or load_bundle()
+    encoded = np.empty((len(vehicles), len(bundle['feature_columns'])), dtype=np.float64)
+
+    for i, column in enumerate(bundle['feature_columns']):
+        vocabulary = bundle['vocabularies'].get(column)
+        if vocabulary is None:
+            encoded[:, i] = vehicles[column].to_numpy(dtype=np.float64)
+            continue
+
+        codes = pd.Categorical(vehicles[column], categories=vocabulary).codes
+        if (codes < 0).any():
+            unknown = sorted(set(vehicles[column][codes < 0]))
+            raise ValueError(f"Unknown {column} values: {unknown}")
+        encoded[:, i] = codes
+
+    return encoded
+
+def preprocess_batch(vehicles):
+    """Encode and scale a vehicle table into float64 model inputs."""
+    bundle = load_bundle()
+    return (encode_features(vehicles, bundle) - bundle['scaler_mean']) / bundle['scaler_scale']
 
 def preprocess_input(vehicle_class, engine_size, cylinders, transmission, fuel_type):
-    # Create mapping dictionaries for categorical variables
-    vehicle_class_map = {
-        'COMPACT': 0,
-        'SUV - SMALL': 11,
-        'MID-SIZE': 2,
-        'TWO-SEATER': 13,
-        'MINICOMPACT': 3,
-        'SUBCOMPACT': 10,
-        'FULL-SIZE': 1,
-        'STATION WAGON - SMALL': 9,
-        'SUV - STANDARD': 12,
-        'VAN - CARGO': 14,
-        'VAN - PASSENGER': 15,
-        'PICKUP TRUCK - STANDARD': 6,
-        'MINIVAN': 4,
-        'SPECIAL PURPOSE VEHICLE': 7,
-        'STATION WAGON - MID-SIZE': 8,
-        'PICKUP TRUCK - SMALL': 5
-    }
-    
-    transmission_map = {
-        'AS5': 14,
-        'M6': 25,
-        'AV7': 22,
-        'AS6': 15,
-        'AM6': 8,
-        'A6': 3,
-        'AM7': 9,
-        'AV8': 23,
-        'AS8': 17,
-        'A7': 4,
-        'A8': 5,
-        'M7': 26,
-        'A4': 1,
-        'M5': 24,
-        'AV': 19,
-        'A5': 2,
-        'AS7': 16,
-        'A9': 6,
-        'AS9': 18,
-        'AV6': 21,
-        'AS4': 13,
-        'AM5': 7,
-        'AM8': 10,
-        'AM9': 11,
-        'AS10': 12,
-        'A10': 0,
-        'AV10': 20
-    }
-    
-    fuel_type_map = {
-        'Z': 4,
-        'D': 0,
-        'X': 3,
-        'E': 1,
-        'N': 2
+    vehicle = pd.DataFrame([{
+        'Vehicle_Class': vehicle_class,
+        'Engine_Size': engine_size,
+        'Cylinders': cylinders,
+        'Transmission': transmission,
+        'Fuel_Type': fuel_type
+    }])
+    return preprocess_batch(vehicle)
+
+# Load the trained model once per process; every session shares the same instance
+@st.cache_resource
+def load_model(path=BUNDLE_PATH, runtime=INFERENCE_RUNTIME):
+    if runtime == "onnx" and onnxruntime is not None and os.path.exists(ONNX_PATH):
+        return OnnxEmissionPredictor(ONNX_PATH)
+    # The NumPy path runs in float64 so single-row and batched calls agree regardless of chunking
+    return NumpyEmissionPredictor(load_bundle(path)['weights'])
+
+# Memory-map the lookup table once per process; None when missing or built from another bundle
+@st.cache_resource
+def load_lookup_table(path=LOOKUP_PATH, metadata_path=LOOKUP_METADATA_PATH, bundle_path=BUNDLE_PATH):
+    if not (os.path.exists(path) and os.path.exists(metadata_path)):
+        return None
+
+    with open(metadata_path) as f:
+        metadata = json.load(f)
+    with open(bundle_path, 'rb') as f:
+        if hashlib.sha256(f.read()).hexdigest() != metadata['bundle_sha256']:
+            return None
+
+    bundle = load_bundle(bundle_path)
+    return {
+        'table': np.load(path, mmap_mode='r'),
+        'metadata': metadata,
+        'codes': {
+            column: {label: code for code, label in enumerate(vocabulary)}
+            for column, vocabulary in bundle['vocabularies'].items()
+        }
     }
-    
-    # Convert inputs to numerical values
-    vehicle_class_num = vehicle_class_map[vehicle_class]
-    transmission_num = transmission_map[transmission]
-    fuel_type_num = fuel_type_map[fuel_type]
-    
-    # Create input array
-    input_data = np.array([[
-        vehicle_class_num,
-        float(engine_size),
-        int(cylinders),
-        transmission_num,
-        fuel_type_num
-    ]])
-    
-    # Scale input data
-    scaler = StandardScaler()
-    # Note: In production, you should load the same scaler used during training
-    scaled_input = scaler.fit_transform(input_data)
-    
-    return scaled_input
-
-# Load the trained model
-def load_model():
-    model = EmissionPredictor(input_dim=5)
-    model.load_state_dict(torch.load(dirname + '/models/emission_predictor.pth'))
-    model.eval()
-    return model
\ No newline at end of file
+
+def lookup_prediction(vehicle_class, engine_size, cylinders, transmission, fuel_type):
+    """
+    Read a prediction from the precomputed table.
+
+    Returns:
+        tuple: (CO2 emissions, fuel consumption), or None when there is no
+        table or the input falls outside its grid.
+    """
+    lookup = load_lookup_table()
+    if lookup is None:
+        return None
+
+    codes = lookup['codes']
+    metadata = lookup['metadata']
+    table = lookup['table']
+
+    step = metadata['engine_size_step']
+    engine_index = round((float(engine_size) - metadata['engine_size_start']) / step)
+    if abs(metadata['engine_size_start'] + engine_index * step - float(engine_size)) > 1e-6:
+        return None
+
+    index = (
+        codes['Vehicle_Class'].get(vehicle_class),
+        codes['Transmission'].get(transmission),
+        codes['Fuel_Type'].get(fuel_type),
+        int(cylinders) - metadata['cylinders_start'],
+        engine_index
+    )
+    if None in index or any(i < 0 or i >= n for i, n in zip(index, table.shape)):
+        return None
+
+    prediction = table[index]
+    return float(prediction[0]), float(prediction[1])
+
+def predict(vehicle_class, engine_size, cylinders, transmission, fuel_type):
+    """
+    Predict emissions for one vehicle.
+
+    On-grid inputs are answered from the precomputed lookup table; anything
+    else runs the shared, warm model. The table is float64 and built with the
+    same forward pass, so both paths agree with `predict_batch` to rounding.
+
+    Args:
+        vehicle_class (str): Vehicle class label, e.g. "COMPACT".
+        engine_size (float): Engine size in liters.
+        cylinders (int): Number of cylinders.
+        transmission (str): Transmission code, e.g. "AS5".
+        fuel_type (str): Fuel type code, e.g. "Z".
+
+    Returns:
+        tuple: (CO2 emissions in g/km, fuel consumption in L/100 km)
+    """
+    prediction = lookup_prediction(vehicle_class, engine_size, cylinders, transmission, fuel_type)
+    if prediction is not None:
+        return prediction
+
+    input_data = preprocess_input(vehicle_class, engine_size, cylinders, transmission, fuel_type)
+    prediction = run_model(input_data)
+    return prediction[0][0].item(), prediction[0][1].item()
+
+def run_model(inputs, chunk_size=PREDICT_CHUNK_SIZE):
+    """Run the shared model over float64 inputs in chunks and return an (N, 2) array."""
+    model = load_model()
+    outputs = []
+    for start in range(0, len(inputs), chunk_size):
+        outputs.append(model(inputs[start:start + chunk_size]))
+    if not outputs:
+        return np.empty((0, 2), dtype=np.float64)
+    return np.concatenate(outputs)
+
+def predict_batch(vehicles, chunk_size=PREDICT_CHUNK_SIZE):
+    """
+    Predict emissions for a whole table of vehicles.
+
+    Args:
+        vehicles (pd.DataFrame): Table with Vehicle_Class, Engine_Size, Cylinders,
+            Transmission and Fuel_Type columns, e.g.
+            model/co2_emission_canada.tsv.
+        chunk_size (int): Rows per forward pass.
+
+    Returns:
+        pd.DataFrame: CO2_Emissions and Fuel_Consumption_Comb predictions,
+        aligned to the index of `vehicles`.
+    """
+    prediction = run_model(preprocess_batch(vehicles), chunk_size)
+    return pd.DataFrame(prediction, columns=load_bundle()['target_columns'], index=vehicles.index)
@@ -1,167 +1,339 @@
 import pandas as pd
 import requests
 import googlemaps
+import time
 from datetime import datetime
 import streamlit as st
 import numpy as np
-import polyline
+
+from pages.utils.cache_utils import SQLiteCache
+from pages.utils.concurrency_utils import fetch_concurrently
+from pages.utils.station_index_utils import station_index
+from pages.utils.route_utils import decode_route
+
+# Upper bound on simultaneous Maps requests and the per-request timeout (seconds)
+MAX_CONCURRENT_REQUESTS = 8
+REQUEST_TIMEOUT = 10
+
+STATION_DETAIL_FIELDS = ['name', 'geometry', 'vicinity', 'rating', 'user_ratings_total', 'reviews']
+
+# Station metadata rarely changes, so place details are kept for a day
+PLACE_DETAILS_TTL = 24 * 60 * 60
+PLACE_DETAILS_MAX_ENTRIES = 5000
+
+place_details_cache = SQLiteCache(
+    'place_details', ttl=PLACE_DETAILS_TTL, max_entries=PLACE_DETAILS_MAX_ENTRIES
+)
+
+# Planned routes (directions, stations and review summaries) are reused for a few hours
+ROUTE_RESULT_TTL = 6 * 60 * 60
+ROUTE_RESULT_MAX_ENTRIES = 200
+# Part of every route result key; bump when the shape of a stored result changes
+ROUTE_RESULT_SCHEMA = 2
+
+route_result_cache = SQLiteCache(
+    'route_results', ttl=ROUTE_RESULT_TTL, max_entries=ROUTE_RESULT_MAX_ENTRIES
+)
+
+# Typed place names rarely move; directions are refreshed more often to pick up road changes
+GEOCODE_TTL = 30 * 24 * 60 * 60
+GEOCODE_MAX_ENTRIES = 5000
+DIRECTIONS_TTL = 6 * 60 * 60
+DIRECTIONS_MAX_ENTRIES = 1000
+
+geocode_cache = SQLiteCache('geocode', ttl=GEOCODE_TTL, max_entries=GEOCODE_MAX_ENTRIES)
+directions_cache = SQLiteCache('directions', ttl=DIRECTIONS_TTL, max_entries=DIRECTIONS_MAX_ENTRIES)
 
 GOOGLE_MAPS_API_KEY = st.secrets["google"]["map_api_key"]
-gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
+gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY, timeout=REQUEST_TIMEOUT)
+
+def normalize_place_text(text):
+    """Canonical form of a typed place name, so case and spacing differences share cache entries."""
+    return " ".join(text.split()).casefold()
+
+def resolve_place(text):
+    """
+    Geocode a typed place name, served from the shared geocode cache when possible.
+
+    Args:
+        text (str): Place name or address as typed by the user.
 
-def get_route(origin, destination):
+    Returns:
+        dict: place_id, lat, lng and formatted_address of the best match, or
+        None if the text could not be geocoded.
+    """
+    key = normalize_place_text(text)
+    place = geocode_cache.get(key)
+    if place is None:
+        results = gmaps.geocode(key)
+        if not results:
+            return None
+        location = results[0]['geometry']['location']
+        place = {
+            'place_id': results[0]['place_id'],
+            'lat': location['lat'],
+            'lng': location['lng'],
+            'formatted_address': results[0].get('formatted_address')
+        }
+        geocode_cache.set(key, place)
+    return place
+
+def resolve_endpoint(text):
+    """
+    Directions endpoint for a typed place: its place ID when it can be
+    geocoded, otherwise the normalized text itself.
+    """
     try:
-        # Request directions
-        directions_result = gmaps.directions(
-            origin,
-            destination,
-            mode="driving",
-            alternatives=True
-        )
+        place = resolve_place(text)
+    except Exception:
+        # Keys without the Geocoding API, or out of quota, can still get
+        # directions; they only miss sharing the cache across spellings
+        place = None
+    return f"place_id:{place['place_id']}" if place else normalize_place_text(text)
+
+def get_route(origin, destination, mode="driving", ttl=DIRECTIONS_TTL):
+    """
+    Fetch driving directions with alternatives between two typed places.
+
+    Both ends are resolved to place IDs first, so differently typed names of
+    the same place share one cached directions response.
+
+    Args:
+        origin (str): Starting point as typed by the user.
+        destination (str): Destination as typed by the user.
+        mode (str): Travel mode; part of the cache key.
+        ttl (float): Seconds a cached directions response stays valid.
+
+    Returns:
+        list: Directions routes, or None on error.
+    """
+    try:
+        endpoints = [resolve_endpoint(text) for text in (origin, destination)]
+        key = f"{mode}|{endpoints[0]}|{endpoints[1]}"
+        directions_result = directions_cache.get(key)
+        if directions_result is None:
+            # Request directions
+            directions_result = gmaps.directions(
+                endpoints[0],
+                endpoints[1],
+                mode=mode,
+                alternatives=True
+            )
+            if directions_result:
+                directions_cache.set(key, directions_result, ttl)
         return directions_result
     except Exception as e:
         st.error(f"Error getting route: {str(e)}")
         return None
 
-def get_points_along_route(route, interval_km=50):
-    # Get total distance in meters
-    total_distance = route[0]['legs'][0]['distance']['value']
-    
-    # Calculate number of points based on distance
-    num_intervals = max(2, int(total_distance / (interval_km * 1000)))
-    
-    route_coords = []
-    for step in route[0]['legs'][0]['steps']:
-        points = polyline.decode(step['polyline']['points'])
-        route_coords.extend(points)
-    
-    route_coords = np.array(route_coords)
-    
-    # Always include start and end points
-    points = [route_coords[0]]
-    
-    if num_intervals > 2:
-        # Add intermediate points at specified intervals
-        for i in range(1, num_intervals):
-            idx = int((i * len(route_coords)) / num_intervals)
-            points.append(route_coords[idx])
-    
-    # Add end point
-    points.append(route_coords[-1])
-    
-    return [(point[0], point[1]) for point in points]
-
-
-def get_petronas_stations_along_route(route, radius=5000):
-    stations = {}
-    route_points = get_points_along_route(route)
+def route_cache_key(origin, destination, radius):
+    return f"v{ROUTE_RESULT_SCHEMA}|{normalize_place_text(origin)}|{normalize_place_text(destination)}|{int(radius)}"
+
+def get_points_along_routes(routes, radius=5000, skip_searched=True):
+    """
+    Pick search centres for the stretches of the routes whose stations are not indexed yet.
+
+    Stretches are sampled with `DecodedRoute.sample` at sqrt(3) * radius
+    spacing, so neighbouring search circles overlap and together cover a band
+    of radius / 2 on either side of the route. Only stretches whose corridor is
+    not already covered by searches recorded in the station index, or by
+    centres picked for an earlier route in the same call, are sampled, so
+    alternatives that share roads search them once.
+
+    Args:
+        routes (list): DecodedRoute alternatives.
+        radius (int): places_nearby search radius in meters.
+        skip_searched (bool): Skip stretches covered by recorded searches; set
+            to False to search every route again.
+
+    Returns:
+        list: (lat, lng) tuples, empty if every route is already covered.
+    """
+    points = []
+    for route in routes:
+        if not skip_searched and not points:
+            new_road = np.ones(len(route), dtype=bool)
+        else:
+            new_road = station_index.uncovered(route.coords, radius, points, include_searched=skip_searched)
+
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], new_road.astype(int), [0]))))
+        for start, end in zip(edges[::2], edges[1::2]):
+            # Include a vertex on either side so the stretch joins the covered road
+            start, end = max(start - 1, 0), min(end, len(route) - 1)
+            stretch = route.sample(
+                np.sqrt(3) * radius, route.cumulative_distances[start], route.cumulative_distances[end]
+            )
+            points.extend(tuple(point) for point in stretch.tolist())
+    return points
+
+def search_stations_nearby(location, radius=None):
+    """
+    Collect every Petronas station result around a location, following page tokens.
+
+    Args:
+        location (dict): {'lat': ..., 'lng': ...} search centre.
+        radius (int): Search radius in meters, or None for the API default.
+
+    Returns:
+        list: Raw places_nearby results across all pages.
+    """
+    params = {'location': location, 'keyword': 'Petronas station'}
+    if radius is not None:
+        params['radius'] = radius
+
+    places = []
+    result = gmaps.places_nearby(**params)
+    while True:
+        places.extend(result.get('results', []))
+        if 'next_page_token' not in result:
+            break
+        # The next page token only becomes valid after a short delay
+        time.sleep(2)
+        result = gmaps.places_nearby(page_token=result['next_page_token'], **params)
+    return places
+
+def get_place_details(place_id, fields=STATION_DETAIL_FIELDS):
+    """
+    Fetch place details, served from the shared place details cache when possible.
+
+    Args:
+        place_id (str): Google place id.
+        fields (list): Detail fields to request; part of the cache key.
+
+    Returns:
+        dict: The `result` payload of the place details response.
+    """
+    key = place_id + '|' + ','.join(sorted(fields))
+    return place_details_cache.get_or_set(
+        key, lambda: gmaps.place(place_id, fields=fields).get('result', {})
+    )
+
+def fetch_station_details(place_ids, max_workers=MAX_CONCURRENT_REQUESTS):
+    """
+    Fetch place details for a batch of stations concurrently.
+
+    Returns:
+        tuple: (details, errors) where details maps place_id to its result dict.
+    """
+    place_ids = list(place_ids)
+    results, errors = fetch_concurrently(
+        get_place_details, [(place_id,) for place_id in place_ids], max_workers
+    )
+    details = {place_id: result or {} for place_id, result in zip(place_ids, results)}
+    return details, {place_ids[i]: e for i, e in errors.items()}
+
+def build_station_record(place, details):
+    return {
+        'Station Name': place['name'],
+        'Latitude': place['geometry']['location']['lat'],
+        'Longitude': place['geometry']['location']['lng'],
+        'Address': place.get('vicinity', 'Address not available'),
+        'Rating': place.get('rating', 'No rating'),
+        'Total Ratings': place.get('user_ratings_total', 0),
+        'Place ID': place['place_id'],
+        'Reviews': details.get('reviews', [])
+    }
+
+def get_petronas_stations_along_routes(routes, radius=5000, refresh=False, max_workers=MAX_CONCURRENT_REQUESTS):
+    """
+    Find the stations along every alternative route in one pass.
+
+    Places is only searched along the stretches the station index has not
+    searched before, unless `refresh` is set. Search centres are shared
+    between alternatives where they follow the same roads and each station's
+    details are fetched once. Stations are then assigned to each alternative
+    through the station index corridor query.
+
+    Args:
+        routes (list): DecodedRoute alternatives.
+        radius (int): Search radius and corridor half-width in meters.
+        refresh (bool): Search every route again, ignoring recorded searches.
+
+    Returns:
+        list: One pd.DataFrame of stations per alternative.
+    """
+    route_points = get_points_along_routes(routes, radius, skip_searched=not refresh)
+    if route_points:
+        get_petronas_stations_near_points(route_points, radius, max_workers)
+    return [get_petronas_stations_in_corridor(route, radius) for route in routes]
+
+def get_petronas_stations_near_points(route_points, radius=5000, max_workers=MAX_CONCURRENT_REQUESTS):
     st.write(f"Searching at {len(route_points)} points along the route...")
-    
-    for i, point in enumerate(route_points):
-        progress_text = f"Searching near point {i+1}/{len(route_points)}"
-        with st.spinner(progress_text):
-            try:
-                result = gmaps.places_nearby(
-                    location={'lat': point[0], 'lng': point[1]},
-                    keyword='Petronas station',
-                    radius=radius
-                )
-                
-                while True:
-                    for place in result.get('results', []):
-                        if place['place_id'] not in stations:
-                            place_details = gmaps.place(
-                                place['place_id'],
-                                fields=['name', 'geometry', 'vicinity', 'rating', 'user_ratings_total', 'reviews']
-                            )
-                            details = place_details.get('result', {})
-                            
-                            # Calculate distance from route
-                            station_location = (place['geometry']['location']['lat'], 
-                                             place['geometry']['location']['lng'])
-                            
-                            stations[place['place_id']] = {
-                                'Station Name': place['name'],
-                                'Latitude': station_location[0],
-                                'Longitude': station_location[1],
-                                'Address': place.get('vicinity', 'Address not available'),
-                                'Rating': place.get('rating', 'No rating'),
-                                'Total Ratings': place.get('user_ratings_total', 0),
-                                'Place ID': place['place_id'],
-                                'Reviews': details.get('reviews', []),
-                                'Search Point': f"Point {i+1}/{len(route_points)}"
-                            }
-                    
-                    if 'next_page_token' not in result:
-                        break
-                        
-                    time.sleep(2)
-                    result = gmaps.places_nearby(
-                        location={'lat': point[0], 'lng': point[1]},
-                        keyword='Petronas station',
-                        radius=radius,
-                        page_token=result['next_page_token']
-                    )
-                    
-            except Exception as e:
-                st.error(f"Error fetching stations at point {i+1}: {str(e)}")
-    
-    return pd.DataFrame(list(stations.values()))
+
+    with st.spinner(f"Searching near {len(route_points)} points..."):
+        search_results, search_errors = fetch_concurrently(
+            search_stations_nearby,
+            [({'lat': point[0], 'lng': point[1]}, radius) for point in route_points],
+            max_workers
+        )
+    for i, e in sorted(search_errors.items()):
+        st.error(f"Error fetching stations at point {i+1}: {str(e)}")
+    # Failed points are not recorded, so the next plan searches them again
+    station_index.record_search(
+        [point for i, point in enumerate(route_points) if i not in search_errors], radius
+    )
+
+    # Dedupe across search points, keeping the first point that found each station
+    places = {}
+    for i, results in enumerate(search_results):
+        for place in results or []:
+            if place['place_id'] not in places:
+                places[place['place_id']] = (i, place)
+
+    with st.spinner(f"Fetching details for {len(places)} stations..."):
+        details, detail_errors = fetch_station_details(places.keys(), max_workers)
+    for place_id, e in detail_errors.items():
+        st.error(f"Error fetching details for {places[place_id][1]['name']}: {str(e)}")
+
+    stations = []
+    for place_id, (i, place) in places.items():
+        station = build_station_record(place, details[place_id])
+        station['Search Point'] = f"Point {i+1}/{len(route_points)}"
+        stations.append(station)
+
+    stations = pd.DataFrame(stations)
+    station_index.update(stations)
+    return stations
+
+def get_petronas_stations_in_corridor(route, radius=5000):
+    """
+    Find known stations within `radius` meters of the route without remote calls.
+
+    Stations come from the local station index, which is seeded and refreshed
+    by `get_petronas_stations` and `get_petronas_stations_along_routes`.
+
+    Args:
+        route (list or DecodedRoute): Directions result as returned by `get_route`.
+        radius (int): Corridor half-width in meters.
+
+    Returns:
+        pd.DataFrame: Matching stations, empty if none are indexed yet.
+    """
+    return station_index.query_corridor(decode_route(route).coords, radius)
 
 def get_station_reviews(place_id):
     try:
         # Get place details including reviews
-        result = gmaps.place(place_id, fields=['reviews', 'rating'])
-        reviews = result.get('result', {}).get('reviews', [])
+        result = get_place_details(place_id, fields=['reviews', 'rating'])
+        reviews = result.get('reviews', [])
         return reviews
     except Exception as e:
         st.error(f"Error fetching reviews: {str(e)}")
         return []
 
-def get_petronas_stations():
-    stations = []
-    search_query = "Petronas station Malaysia"
+def get_petronas_stations(max_workers=MAX_CONCURRENT_REQUESTS):
     location = {'lat': 4.2105, 'lng': 101.9758}
-    
-    try:
-        result = gmaps.places_nearby(
-            location=location,
-            keyword='Petronas station'
-        )
-
-        while True:
-            for place in result.get('results', []):
-                # Get detailed place information including reviews
-                place_details = gmaps.place(place['place_id'], 
-                    fields=['name', 'geometry', 'vicinity', 'rating', 
-                           'user_ratings_total', 'reviews'])
-                
-                details = place_details.get('result', {})
-                reviews = details.get('reviews', [])
-                
-                station_info = {
-                    'Station Name': place['name'],
-                    'Latitude': place['geometry']['location']['lat'],
-                    'Longitude': place['geometry']['location']['lng'],
-                    'Address': place.get('vicinity', 'Address not available'),
-                    'Rating': place.get('rating', 'No rating'),
-                    'Total Ratings': place.get('user_ratings_total', 0),
-                    'Place ID': place['place_id'],
-                    'Reviews': reviews
-                }
-                stations.append(station_info)
-
-            if 'next_page_token' in result:
-                time.sleep(2)
-                result = gmaps.places_nearby(
-                    location=location,
-                    keyword='Petronas station',
-                    page_token=result['next_page_token']
-                )
-            else:
-                break
 
+    try:
+        places = search_stations_nearby(location)
     except Exception as e:
         st.error(f"Error fetching station data: {str(e)}")
-    
-    return pd.DataFrame(stations)
\ No newline at end of file
+        return pd.DataFrame()
+
+    details, errors = fetch_station_details([place['place_id'] for place in places], max_workers)
+    for place_id, e in errors.items():
+        st.error(f"Error fetching station data: {str(e)}")
+
+    stations = pd.DataFrame([build_station_record(place, details[place['place_id']]) for place in places])
+    station_index.update(stations)
+    return stations
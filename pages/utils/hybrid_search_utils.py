@@ -0,0 +1,187 @@
+import bisect
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from pymongo.errors import PyMongoError
+
+from pages.utils.search_button_utils import SEARCH_FIELDS, client, vector_search
+
+# BM25 parameters; name tokens are counted NAME_WEIGHT times so title hits outrank description hits
+BM25_K1 = 1.2
+BM25_B = 0.75
+NAME_WEIGHT = 2
+# Prefix-only term matches (e.g. "mes" -> "mesra") count for this fraction of a full match
+PREFIX_WEIGHT = 0.5
+
+# Reciprocal rank fusion constant and how many candidates each ranker contributes
+RRF_K = 60
+RRF_CANDIDATES = 20
+# Multiplier range applied from click popularity, 0 disables the boost
+CLICK_BOOST = 0.2
+
+# Seconds before the keyword index is rebuilt from the collection
+KEYWORD_INDEX_TTL = 5 * 60
+
+_keyword_index = None
+_keyword_index_built_at = 0.0
+_keyword_index_lock = threading.Lock()
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+
+class KeywordIndex:
+    """
+    BM25 inverted index with prefix matching over catalog names and descriptions.
+
+    Args:
+        docs (list): Catalog documents with "name" and "description" fields.
+    """
+
+    def __init__(self, docs):
+        self.documents = list(docs)
+        self.postings = defaultdict(dict)
+        self.lengths = []
+        self.names = []
+
+        for i, doc in enumerate(self.documents):
+            name_tokens = tokenize(doc.get("name"))
+            terms = Counter(name_tokens * NAME_WEIGHT + tokenize(doc.get("description")))
+            for term, count in terms.items():
+                self.postings[term][i] = count
+            self.lengths.append(sum(terms.values()))
+            self.names.append(name_tokens)
+
+        self.vocabulary = sorted(self.postings)
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def _expand(self, token):
+        """Vocabulary terms matching `token`, with full matches weighted above prefix matches."""
+        weights = {}
+        start = bisect.bisect_left(self.vocabulary, token)
+        for term in self.vocabulary[start:]:
+            if not term.startswith(token):
+                break
+            weights[term] = 1.0 if term == token else PREFIX_WEIGHT
+        return weights
+
+    def exact_matches(self, query):
+        """Documents whose name contains every query token as a whole word."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        return [
+            self.documents[i] for i, name in enumerate(self.names)
+            if name and all(token in name for token in tokens)
+        ]
+
+    def search(self, query, limit=RRF_CANDIDATES):
+        """
+        Rank documents by BM25 over the query tokens and their prefix expansions.
+
+        Returns:
+            list: (document, score) pairs, best first.
+        """
+        scores = defaultdict(float)
+        total = len(self.documents)
+        for token in set(tokenize(query)):
+            for term, weight in self._expand(token).items():
+                postings = self.postings[term]
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for i, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / self.average_length)
+                    scores[i] += weight * idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(self.documents[i], score) for i, score in ranked]
+
+def get_keyword_index(max_age=KEYWORD_INDEX_TTL):
+    """
+    Return the keyword index, rebuilding it from the collection when stale.
+
+    If a rebuild fails, the previous index keeps serving.
+
+    Returns:
+        KeywordIndex: The last good index, or None if it was never built.
+    """
+    global _keyword_index, _keyword_index_built_at
+
+    with _keyword_index_lock:
+        if _keyword_index is not None and time.time() - _keyword_index_built_at < max_age:
+            return _keyword_index
+        try:
+            _keyword_index = KeywordIndex(client["Home"]["Home Icons"].find({}, SEARCH_FIELDS))
+            _keyword_index_built_at = time.time()
+        except PyMongoError:
+            pass
+        return _keyword_index
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse several ranked document lists, identifying documents by name.
+
+    Returns:
+        list: (document, fused score) pairs, best first.
+    """
+    scores = defaultdict(float)
+    documents = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            scores[doc["name"]] += 1.0 / (k + rank + 1)
+            documents.setdefault(doc["name"], doc)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(documents[name], score) for name, score in ranked]
+
+def apply_click_boost(results, boost=CLICK_BOOST):
+    """Scale fused scores by up to (1 + boost) according to log-scaled click counts."""
+    if not results or not boost:
+        return results
+    max_clicks = max(doc.get("clicks", 0) for doc, _ in results)
+    if max_clicks <= 0:
+        return results
+    boosted = [
+        (doc, score * (1 + boost * math.log1p(doc.get("clicks", 0)) / math.log1p(max_clicks)))
+        for doc, score in results
+    ]
+    return sorted(boosted, key=lambda item: item[1], reverse=True)
+
+def hybrid_search(user_query, limit=4, click_boost=CLICK_BOOST):
+    """
+    Search the catalog by keyword and meaning.
+
+    Queries that name items exactly (e.g. "Mesra", "NGV") are answered from
+    the keyword index alone, without embedding the query. Otherwise BM25 and
+    vector search rankings are combined with reciprocal rank fusion and
+    optionally boosted by click popularity.
+
+    When the keyword index cannot be built, results come from vector search
+    alone, which itself falls back to the local vector index. When vector
+    search fails, keyword results are returned alone.
+
+    Args:
+        user_query (str): The user's query string.
+        limit (int): Number of documents to return.
+        click_boost (float): Popularity boost strength, 0 to disable.
+
+    Returns:
+        list: Matching documents with a "score" field, best first.
+    """
+    index = get_keyword_index()
+    if index is None:
+        return vector_search(user_query, limit=limit)
+
+    exact = index.exact_matches(user_query)
+    if exact:
+        keyword_scores = {doc["name"]: score for doc, score in index.search(user_query, len(index.documents))}
+        ranked = sorted(exact, key=lambda doc: keyword_scores.get(doc["name"], 0.0), reverse=True)
+        return [dict(doc, score=keyword_scores.get(doc["name"], 0.0)) for doc in ranked[:limit]]
+
+    keyword_ranking = [doc for doc, _ in index.search(user_query, RRF_CANDIDATES)]
+    try:
+        vector_ranking = vector_search(user_query, limit=RRF_CANDIDATES)
+    except PyMongoError:
+        vector_ranking = []
+    fused = apply_click_boost(reciprocal_rank_fusion([keyword_ranking, vector_ranking]), click_boost)
+    return [dict(doc, score=score) for doc, score in fused[:limit]]
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+# RON 97 pump price in RM per litre
+FUEL_PRICE = 3.19
+
+# Weights over comparison columns for each way of picking a route
+OBJECTIVES = {
+    "Cheapest": {"Fuel Cost (RM)": 1.0},
+    "Greenest": {"CO2 (kg)": 1.0},
+    "Fastest": {"Duration (min)": 1.0},
+    "Balanced": {"Fuel Cost (RM)": 0.5, "Duration (min)": 0.5}
+}
+
+def compare_routes(routes, co2_emission, fuel_consumption, station_counts=None, fuel_price=FUEL_PRICE):
+    """
+    Cost out every alternative route for one vehicle.
+
+    Args:
+        routes (list): DecodedRoute alternatives.
+        co2_emission (float): Predicted CO2 emissions in g/km.
+        fuel_consumption (float): Predicted fuel consumption in L/100 km.
+        station_counts (list): Stations found along each alternative.
+        fuel_price (float): Fuel price in RM per litre.
+
+    Returns:
+        pd.DataFrame: One row per alternative with its distance, duration,
+        fuel use, fuel cost, CO2 and station count.
+    """
+    distance_km = np.array([route.distance_km for route in routes])
+    fuel_litres = distance_km * fuel_consumption / 100
+    return pd.DataFrame({
+        "Route": [
+            f"Route {i + 1}" + (f" via {route.summary}" if route.summary else "")
+            for i, route in enumerate(routes)
+        ],
+        "Distance (km)": distance_km,
+        "Duration (min)": np.array([route.duration_s for route in routes]) / 60,
+        "Fuel (L)": fuel_litres,
+        "Fuel Cost (RM)": fuel_litres * fuel_price,
+        "CO2 (kg)": distance_km * co2_emission / 1000,
+        "Stations": station_counts if station_counts is not None else np.zeros(len(routes), dtype=int)
+    })
+
+def score_routes(comparison, weights):
+    """
+    Weighted sum of min-max normalized comparison columns; lower is better.
+
+    Args:
+        comparison (pd.DataFrame): Output of `compare_routes`.
+        weights (dict): Column name to weight.
+
+    Returns:
+        np.ndarray: One score in [0, sum(weights)] per alternative.
+    """
+    values = comparison[list(weights)].to_numpy(dtype=float)
+    spread = np.ptp(values, axis=0)
+    normalized = (values - values.min(axis=0)) / np.where(spread > 0, spread, 1.0)
+    return normalized @ np.array(list(weights.values()))
+
+def best_route(comparison, objective):
+    """Index of the best alternative for one of the OBJECTIVES."""
+    return int(np.argmin(score_routes(comparison, OBJECTIVES[objective])))
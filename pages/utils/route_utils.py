@@ -0,0 +1,209 @@
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+
+# Google encoded polylines store coordinates as integers of 1e-5 degrees
+POLYLINE_PRECISION = 5
+
+# Web Mercator ground resolution at zoom 0 on the equator, in meters per pixel
+METERS_PER_PIXEL_ZOOM0 = 156543.03392
+# Simplified routes stay within this many screen pixels of the full geometry
+SIMPLIFY_PIXELS = 1.0
+
+def decode_polylines(encoded, precision=POLYLINE_PRECISION):
+    """
+    Decode several Google encoded polylines in one vectorized pass.
+
+    Args:
+        encoded (list): Encoded polyline strings, e.g. one per directions step.
+        precision (int): Decimal places the coordinates were encoded with.
+
+    Returns:
+        tuple: (N, 2) float64 array of (lat, lng) for all polylines back to
+        back, and (len(encoded) + 1,) int array of offsets where each one starts.
+    """
+    data = np.frombuffer("".join(encoded).encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+
+    # Each value is a run of 5-bit chunks, least significant first; the last
+    # chunk of a run has its continuation bit (0x20) clear
+    ends = np.flatnonzero(data < 0x20)
+    data = data[:ends[-1] + 1] if len(ends) else data[:0]
+    starts = np.concatenate(([0], ends[:-1] + 1))[:len(ends)]
+    shifts = 5 * (np.arange(len(data)) - np.repeat(starts, ends - starts + 1))
+    values = np.add.reduceat((data & 0x1f) << shifts, starts) if len(ends) else np.empty(0, np.int64)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1).reshape(-1, 2)
+
+    # Every polyline starts from an absolute coordinate, so accumulate per polyline
+    byte_offsets = np.cumsum([0] + [len(text) for text in encoded])
+    offsets = np.searchsorted(ends, byte_offsets) // 2
+    totals = np.cumsum(deltas, axis=0)
+    before = np.vstack((np.zeros((1, 2), np.int64), totals))[offsets[:-1]]
+    coords = totals - np.repeat(before, np.diff(offsets), axis=0)
+    return coords / 10.0 ** precision, offsets
+
+def haversine_distances(coords):
+    """
+    Great-circle length in meters of every segment of a (lat, lng) polyline.
+
+    Args:
+        coords (np.ndarray): (N, 2) array of (lat, lng) in degrees.
+
+    Returns:
+        np.ndarray: (N - 1,) segment lengths.
+    """
+    lat = np.radians(coords[:, 0])
+    lng = np.radians(coords[:, 1])
+    a = (np.sin(np.diff(lat) / 2) ** 2
+         + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+def project_coords(coords, latitude):
+    """
+    Equirectangular projection of (lat, lng) degrees to planar meters.
+
+    Args:
+        coords (np.ndarray): (N, 2) array of (lat, lng) in degrees.
+        latitude (float): Reference latitude where east-west scale is exact.
+
+    Returns:
+        np.ndarray: (N, 2) array of (x, y) in meters.
+    """
+    xy = np.radians(coords[:, ::-1]) * EARTH_RADIUS_M
+    xy[:, 0] *= np.cos(np.radians(latitude))
+    return xy
+
+def simplify_coords(coords, tolerance_m):
+    """
+    Douglas-Peucker simplification of a (lat, lng) polyline.
+
+    Distances are measured on a local equirectangular projection, which is
+    accurate to well under a percent over the extent of a driving route.
+
+    Args:
+        coords (np.ndarray): (N, 2) array of (lat, lng) in degrees.
+        tolerance_m (float): Largest allowed deviation from the original line.
+
+    Returns:
+        np.ndarray: The retained rows of `coords`, always including both ends.
+    """
+    if len(coords) < 3 or tolerance_m <= 0:
+        return coords
+
+    xy = project_coords(coords, coords[:, 0].mean())
+
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = xy[end] - xy[start]
+        points = xy[start + 1:end] - xy[start]
+        length = np.hypot(segment[0], segment[1])
+        if length > 0:
+            distances = np.abs(segment[0] * points[:, 1] - segment[1] * points[:, 0]) / length
+        else:
+            distances = np.hypot(points[:, 0], points[:, 1])
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance_m:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return coords[keep]
+
+def tolerance_for_zoom(zoom, latitude, pixels=SIMPLIFY_PIXELS):
+    """Ground distance in meters covered by `pixels` screen pixels at a web map zoom level."""
+    return pixels * METERS_PER_PIXEL_ZOOM0 * np.cos(np.radians(latitude)) / 2 ** zoom
+
+class DecodedRoute:
+    """
+    One directions route decoded once and shared by everything that needs its geometry.
+
+    Attributes:
+        summary (str): Directions API route summary, e.g. "E8 and E35".
+        coords (np.ndarray): Contiguous (N, 2) float64 array of (lat, lng).
+        step_offsets (np.ndarray): Index into `coords` where each step starts,
+            with the total point count appended.
+        cumulative_distances (np.ndarray): (N,) geodesic meters from the start.
+        distance_m (float): Distance reported by the Directions API.
+        duration_s (float): Duration reported by the Directions API.
+        start_location (dict): {'lat': ..., 'lng': ...} of the start.
+        end_location (dict): {'lat': ..., 'lng': ...} of the end.
+
+    Args:
+        route (list): Directions result as returned by `get_route`.
+        alternative (int): Which of the returned routes to decode.
+    """
+
+    def __init__(self, route, alternative=0):
+        leg = route[alternative]['legs'][0]
+        self.summary = route[alternative].get('summary', '')
+        self.distance_m = float(leg['distance']['value'])
+        self.duration_s = float(leg['duration']['value'])
+        self.distance_text = leg['distance']['text']
+        self.duration_text = leg['duration']['text']
+        self.start_location = leg['start_location']
+        self.end_location = leg['end_location']
+
+        coords, self.step_offsets = decode_polylines([step['polyline']['points'] for step in leg['steps']])
+        self.coords = np.ascontiguousarray(coords)
+        self.cumulative_distances = np.concatenate(([0.0], np.cumsum(haversine_distances(self.coords))))
+        self._simplified = {}
+
+    def __len__(self):
+        return len(self.coords)
+
+    @property
+    def length_m(self):
+        """Geodesic length of the decoded polyline in meters."""
+        return float(self.cumulative_distances[-1]) if len(self.coords) else 0.0
+
+    @property
+    def distance_km(self):
+        return self.distance_m / 1000
+
+    def points_at(self, distances):
+        """(lat, lng) array of the points at the given distances along the route, in meters."""
+        lats = np.interp(distances, self.cumulative_distances, self.coords[:, 0])
+        lngs = np.interp(distances, self.cumulative_distances, self.coords[:, 1])
+        return np.column_stack((lats, lngs))
+
+    def sample(self, spacing, start=0.0, end=None):
+        """
+        Evenly spaced points at most `spacing` meters apart between two distances along the route.
+
+        Returns:
+            np.ndarray: (M, 2) array of (lat, lng), including both ends.
+        """
+        end = self.length_m if end is None else end
+        count = max(2, int(np.ceil((end - start) / spacing)) + 1)
+        return self.points_at(np.linspace(start, end, count))
+
+    def simplified(self, zoom):
+        """
+        Route geometry simplified to within a pixel at web map `zoom`, cached per zoom.
+
+        Args:
+            zoom (int): Deepest zoom level the geometry should look exact at.
+
+        Returns:
+            np.ndarray: (M, 2) array of (lat, lng), M <= N.
+        """
+        if zoom not in self._simplified:
+            latitude = self.coords[:, 0].mean() if len(self.coords) else 0.0
+            self._simplified[zoom] = simplify_coords(self.coords, tolerance_for_zoom(zoom, latitude))
+        return self._simplified[zoom]
+
+    def step_coords(self, i):
+        """Coordinates of step `i`, as a view into `coords`."""
+        return self.coords[self.step_offsets[i]:self.step_offsets[i + 1]]
+
+def decode_alternatives(directions):
+    """Decode every alternative route of a directions result."""
+    return [DecodedRoute(directions, i) for i in range(len(directions))]
+
+def decode_route(route):
+    """Return `route` as a DecodedRoute, decoding it only if it is a raw directions result."""
+    return route if isinstance(route, DecodedRoute) else DecodedRoute(route)
@@ -1,16 +1,64 @@
-from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 import streamlit as st
 import os
+import functools
+import threading
+import time
+import numpy as np
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 import certifi
 
-embedding_model = SentenceTransformer("thenlper/gte-small")
+from pages.utils.vector_index_utils import LocalVectorIndex
+
+EMBEDDING_MODEL = "thenlper/gte-small"
+# Number of distinct normalized queries whose embeddings are kept in memory
+QUERY_CACHE_SIZE = 1024
+
+# Atlas searches slower than this fall back to the local vector index
+ATLAS_TIMEOUT_MS = 2000
+# Serve every search from the local index instead of only using it as a fallback
+PREFER_LOCAL_INDEX = False
+# Seconds before the local index is re-synced from the collection
+LOCAL_INDEX_TTL = 10 * 60
 
 MONGODB_URI = st.secrets["mongo"]["host"]
 
 ca = certifi.where()
-client = MongoClient(MONGODB_URI, tlsCAFile=ca)
+client = MongoClient(
+    MONGODB_URI,
+    tlsCAFile=ca,
+    serverSelectionTimeoutMS=ATLAS_TIMEOUT_MS,
+    socketTimeoutMS=ATLAS_TIMEOUT_MS
+)
+
+_local_index = None
+_local_index_synced_at = 0.0
+_local_index_lock = threading.Lock()
+
+SEARCH_FIELDS = {
+    "_id": 0,
+    "name": 1,
+    "picture_url": 1,
+    "clicks": 1,
+    "description": 1
+}
+
+@st.cache_resource
+def get_embedding_model():
+    # Imported here so pages that never search do not pay for loading torch
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+def warm_up():
+    """
+    Load the embedding model and run one encode so the first search is not cold.
+
+    The local vector index is synced too while Atlas is reachable, so a copy
+    exists before the fallback is ever needed.
+    """
+    get_query_embedding("warm up")
+    _sync_local_index_quietly()
 
 def get_embedding(text):
     """
@@ -22,54 +70,127 @@ def get_embedding(text):
     Returns:
         List[float]: Embedding of the text as a list.
     """
-    embedding = embedding_model.encode(text)
+    embedding = get_embedding_model().encode(text)
 
     return embedding.tolist()
 
-def vector_search(user_query):
+def normalize_query(user_query):
+    # The gte-small tokenizer is uncased, so case and spacing never change the embedding
+    return " ".join(user_query.lower().split())
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _cached_query_embedding(normalized_query):
+    embedding = np.asarray(get_embedding_model().encode(normalized_query), dtype=np.float32)
+    # Shared between callers, so it must not be modified in place
+    embedding.setflags(write=False)
+    return embedding
+
+def get_query_embedding(user_query):
+    """
+    Embed a search query, reusing the embedding of any previous equivalent query.
+
+    Args:
+        user_query (str): The user's query string.
+
+    Returns:
+        np.ndarray: Read-only float32 embedding.
+    """
+    return _cached_query_embedding(normalize_query(user_query))
+
+def get_local_index(max_age=LOCAL_INDEX_TTL):
+    """
+    Return the in-process vector index, re-syncing it from the collection when stale.
+
+    If a re-sync fails, the previous index keeps serving so searches still
+    work while Atlas is unreachable.
+
+    Args:
+        max_age (float): Seconds before the index is re-synced, or None to
+            return any synced index as is.
+
+    Returns:
+        LocalVectorIndex: The synced index.
+    """
+    global _local_index, _local_index_synced_at
+
+    with _local_index_lock:
+        if _local_index is not None and (max_age is None or time.time() - _local_index_synced_at < max_age):
+            return _local_index
+        try:
+            docs = client["Home"]["Home Icons"].find(
+                {"embedding": {"$exists": True}}, {**SEARCH_FIELDS, "embedding": 1}
+            )
+            _local_index = LocalVectorIndex(list(docs))
+            _local_index_synced_at = time.time()
+        except PyMongoError:
+            if _local_index is None:
+                raise
+        return _local_index
+
+def _sync_local_index_quietly():
+    try:
+        get_local_index()
+    except PyMongoError:
+        pass
+
+def _refresh_local_index_in_background():
+    # Keep a last good copy while Atlas is healthy, without delaying the search
+    stale = _local_index is None or time.time() - _local_index_synced_at >= LOCAL_INDEX_TTL
+    if stale and not _local_index_lock.locked():
+        threading.Thread(target=_sync_local_index_quietly, name="local-index-sync", daemon=True).start()
+
+def vector_search(user_query, limit=4, prefer_local=PREFER_LOCAL_INDEX):
     """
     Retrieve relevant documents for a user query using vector search.
 
+    Atlas $vectorSearch is used unless `prefer_local` is set. When Atlas errors
+    or takes longer than ATLAS_TIMEOUT_MS, the local vector index answers
+    instead, with the same result shape.
+
     Args:
     user_query (str): The user's query string.
+    limit (int): Number of documents to return.
+    prefer_local (bool): Answer from the local index without querying Atlas.
 
     Returns:
     list: A list of matching documents.
     """
 
-    # Generate embedding for the `user_query` using the `get_embedding` function defined in Step 5
-    query_embedding = get_embedding(user_query)
+    # Generate embedding for the `user_query`, served from the query cache when possible
+    query_embedding = get_query_embedding(user_query)
+
+    if prefer_local:
+        return get_local_index().search(query_embedding, limit)
 
     db = client["Home"]
     collection = db["Home Icons"]
 
     # Define an aggregation pipeline consisting of a $vectorSearch stage, followed by a $project stage
-    # Set the number of candidates to 150 and only return the top 5 documents from the vector search
-    # In the $project stage, exclude the `_id` field and include only the `body` field and `vectorSearchScore`
-    # NOTE: Use variables defined previously for the `index`, `queryVector` and `path` fields in the $vectorSearch stage
+    # Set the number of candidates to 150 and only return the top `limit` documents from the vector search
+    # In the $project stage, exclude the `_id` field and include the display fields and `vectorSearchScore`
     pipeline = [
       {
           "$vectorSearch": {
               "index": "vector_index",
-              "queryVector": query_embedding,
+              "queryVector": query_embedding.tolist(),
               "path": "embedding",
               "numCandidates": 150,
-              "limit": 4,
+              "limit": limit,
           }
       },
       {
           "$project": {
-                "_id": 0,
-                "name": 1,
-                "picture_url": 1,
-                "clicks": 1,
-                "description": 1,
+                **SEARCH_FIELDS,
                 "score": {"$meta": "vectorSearchScore"}
           }
       }
   ]
 
-    # Execute the aggregation `pipeline` and store the results in `results`
-    results = collection.aggregate(pipeline)
-
-    return list(results)
+    # Execute the aggregation `pipeline`, falling back to the local index if Atlas is slow or down
+    try:
+        results = list(collection.aggregate(pipeline, maxTimeMS=ATLAS_TIMEOUT_MS))
+    except PyMongoError:
+        # Serve the last good copy as is; re-syncing it would hit the same failing cluster
+        return get_local_index(max_age=None).search(query_embedding, limit)
+    _refresh_local_index_in_background()
+    return results
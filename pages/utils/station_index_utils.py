@@ -0,0 +1,241 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from shapely import LineString, Point, STRtree, contains_xy, prepare, union_all
+
+dirname = os.path.dirname(__file__)
+
+INDEX_PATH = os.path.join(dirname, '..', 'data', 'stations.pkl')
+
+EARTH_RADIUS_M = 6371000.0
+
+# Searched circles are polygons slightly inside the true circle; allow for that
+# when deciding whether a stretch of road has already been searched
+COVERAGE_SLACK_M = 50
+
+# Searched circles and station rows older than this are searched again, so
+# new and closed stations and fresh reviews are picked up; one day, like place details
+MAX_AGE = 24 * 60 * 60
+
+class StationIndex:
+    """
+    Local spatial index of known Petronas stations.
+
+    Stations are kept in a DataFrame persisted to disk and indexed with a
+    shapely STRtree over a local metric projection, so corridor queries along
+    a route can be answered without calling the Places API.
+
+    The circles already searched with places_nearby are persisted alongside,
+    so callers can tell which stretches of a route the index covers and only
+    search the rest. Circles and stations expire after `max_age` seconds.
+
+    Args:
+        path (str): Pickle file the station table is persisted to.
+        max_age (float): Seconds a search or station row stays valid.
+    """
+
+    def __init__(self, path=INDEX_PATH, max_age=MAX_AGE):
+        self.path = os.path.abspath(path)
+        self.searched_path = self.path.rsplit('.', 1)[0] + '_searched.npy'
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._stations = pd.DataFrame()
+        self._tree = None
+        self._origin = None
+        self._loaded_mtime = None
+        self._searched = np.empty((0, 4))
+        self._searched_mtime = None
+        self._coverage = {}
+
+    def _reload_if_changed(self):
+        # Another process may have refreshed the files since we last read them
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = self._loaded_mtime
+        if mtime != self._loaded_mtime:
+            self._stations = pd.read_pickle(self.path)
+            self._loaded_mtime = mtime
+            self._tree = None
+
+        try:
+            mtime = os.path.getmtime(self.searched_path)
+        except OSError:
+            return
+        if mtime != self._searched_mtime:
+            searched = np.load(self.searched_path)
+            if searched.shape[1] == 3:
+                # Circles recorded before searches were timestamped count as expired
+                searched = np.column_stack([searched, np.zeros(len(searched))])
+            self._searched = searched
+            self._searched_mtime = mtime
+            self._coverage = {}
+
+    def _project(self, lat, lng, lat0=None):
+        # Equirectangular projection around the index's mean latitude, accurate
+        # to well under a percent across the extent of Malaysia
+        lat0 = self._origin if lat0 is None else lat0
+        x = np.radians(lng) * np.cos(np.radians(lat0)) * EARTH_RADIUS_M
+        y = np.radians(lat) * EARTH_RADIUS_M
+        return np.column_stack([x, y])
+
+    def _build(self):
+        self._origin = float(self._stations['Latitude'].mean())
+        xy = self._project(
+            self._stations['Latitude'].to_numpy(dtype=float),
+            self._stations['Longitude'].to_numpy(dtype=float)
+        )
+        self._tree = STRtree([Point(x, y) for x, y in xy])
+
+    def __len__(self):
+        with self._lock:
+            self._reload_if_changed()
+            return len(self._stations)
+
+    def update(self, stations):
+        """
+        Insert or refresh stations, replacing existing rows with the same place id.
+
+        Args:
+            stations (pd.DataFrame): Rows shaped like `get_petronas_stations` output.
+        """
+        if stations is None or stations.empty:
+            return
+
+        stations = stations.drop(columns=['Search Point'], errors='ignore').assign(**{'Indexed At': time.time()})
+        with self._lock:
+            self._reload_if_changed()
+            merged = pd.concat([self._stations, stations], ignore_index=True)
+            merged = merged.drop_duplicates(subset='Place ID', keep='last').reset_index(drop=True)
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            merged.to_pickle(tmp_path)
+            os.replace(tmp_path, self.path)
+
+            self._stations = merged
+            self._loaded_mtime = os.path.getmtime(self.path)
+            self._tree = None
+
+    def record_search(self, points, radius):
+        """
+        Remember that places_nearby has been searched around `points` just now.
+
+        Args:
+            points (list): (lat, lng) search centres that were searched successfully.
+            radius (float): Search radius in meters.
+        """
+        if not len(points):
+            return
+
+        circles = np.column_stack([
+            np.asarray(points, dtype=float), np.full(len(points), float(radius)), np.full(len(points), time.time())
+        ])
+        with self._lock:
+            self._reload_if_changed()
+            searched = np.vstack([self._searched, circles])
+
+            os.makedirs(os.path.dirname(self.searched_path), exist_ok=True)
+            tmp_path = self.searched_path + '.tmp.npy'
+            np.save(tmp_path, searched)
+            os.replace(tmp_path, self.searched_path)
+
+            self._searched = searched
+            self._searched_mtime = os.path.getmtime(self.searched_path)
+            self._coverage = {}
+
+    def _circles_union(self, circles, lat0):
+        xy = self._project(circles[:, 0], circles[:, 1], lat0)
+        return union_all([Point(x, y).buffer(r) for (x, y), r in zip(xy, circles[:, 2])])
+
+    def uncovered(self, route_coords, radius, pending=(), include_searched=True):
+        """
+        Flag the route points whose corridor has not been searched yet.
+
+        A route point is covered when the disc of radius / 2 around it lies
+        inside the union of searched circles, the same band that route
+        sampling guarantees, i.e. when it lies in that union shrunk by radius / 2.
+        Circles older than `max_age` do not count.
+
+        Args:
+            route_coords (array-like): (N, 2) array of (lat, lng) route coordinates.
+            radius (float): Search radius and corridor half-width in meters.
+            pending (list): (lat, lng) centres about to be searched with `radius`,
+                treated as already searched.
+            include_searched (bool): Whether recorded past searches count, or
+                only `pending`.
+
+        Returns:
+            np.ndarray: (N,) bool array, True where the route still needs searching.
+        """
+        route_coords = np.asarray(route_coords, dtype=float)
+        pending = np.asarray(pending, dtype=float).reshape(-1, 2)
+        with self._lock:
+            self._reload_if_changed()
+            fresh = self._searched[:, 3] >= time.time() - self.max_age
+            searched = self._searched[fresh] if include_searched else np.empty((0, 4))
+            if not len(searched) and not len(pending):
+                return np.ones(len(route_coords), dtype=bool)
+
+            if not include_searched:
+                lat0 = float(pending[:, 0].mean())
+                circles = np.column_stack([pending, np.full(len(pending), float(radius))])
+                region = self._circles_union(circles, lat0).buffer(-(radius / 2 - COVERAGE_SLACK_M))
+                xy = self._project(route_coords[:, 0], route_coords[:, 1], lat0)
+                return ~contains_xy(region, xy[:, 0], xy[:, 1])
+
+            # The union of past searches is cached until a search is recorded or expires
+            if 'union' not in self._coverage or not np.array_equal(self._coverage['fresh'], fresh):
+                lat0 = float(searched[:, 0].mean()) if len(searched) else float(pending[:, 0].mean())
+                self._coverage = {'fresh': fresh, 'lat0': lat0, 'union': self._circles_union(searched, lat0)}
+            lat0, union = self._coverage['lat0'], self._coverage['union']
+
+            if len(pending):
+                circles = np.column_stack([pending, np.full(len(pending), float(radius))])
+                region = union_all([union, self._circles_union(circles, lat0)])
+                region = region.buffer(-(radius / 2 - COVERAGE_SLACK_M))
+            else:
+                if radius not in self._coverage:
+                    self._coverage[radius] = union.buffer(-(radius / 2 - COVERAGE_SLACK_M))
+                    prepare(self._coverage[radius])
+                region = self._coverage[radius]
+
+        xy = self._project(route_coords[:, 0], route_coords[:, 1], lat0)
+        return ~contains_xy(region, xy[:, 0], xy[:, 1])
+
+    def query_corridor(self, route_coords, radius):
+        """
+        Return every indexed station within `radius` meters of a route polyline.
+
+        Stations not seen by a search within `max_age` are left out, since
+        they may have closed and their reviews are stale.
+
+        Args:
+            route_coords (array-like): (N, 2) array of (lat, lng) route coordinates.
+            radius (float): Corridor half-width in meters.
+
+        Returns:
+            pd.DataFrame: Matching stations, in index order.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            if self._stations.empty:
+                return pd.DataFrame()
+            if self._tree is None:
+                self._build()
+
+            route_coords = np.asarray(route_coords, dtype=float)
+            xy = self._project(route_coords[:, 0], route_coords[:, 1])
+            geometry = LineString(xy) if len(xy) > 1 else Point(xy[0])
+            matches = np.sort(self._tree.query(geometry.buffer(radius), predicate='intersects'))
+            stations = self._stations.iloc[matches]
+            if 'Indexed At' in stations:
+                stations = stations[stations['Indexed At'] >= time.time() - self.max_age]
+            else:
+                stations = stations.iloc[:0]
+            return stations.drop(columns=['Indexed At'], errors='ignore').reset_index(drop=True)
+
+station_index = StationIndex()
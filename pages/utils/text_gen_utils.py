@@ -1,24 +1,190 @@
 from fireworks.client import Fireworks
 import streamlit as st
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from pages.utils.cache_utils import SQLiteCache
+from pages.utils.concurrency_utils import iter_concurrently
 
 FIREWORKS_API = st.secrets["fireworks"]["api_key"]
 fw_client = Fireworks(api_key=FIREWORKS_API)
 model = "accounts/fireworks/models/llama-v3-8b-instruct"
 
-def generate_answer(user_query):
+# Upper bound on simultaneous Fireworks requests when summarizing reviews
+SUMMARY_MAX_WORKERS = 6
+# Only the first few reviews of each station go into its summary
+SUMMARY_REVIEW_COUNT = 3
+# Review fields that identify review content; relative dates change daily and are left out
+SUMMARY_KEY_FIELDS = ['author_name', 'rating', 'text', 'time']
+
+# Completions are cached per prompt; decimals kept when coordinates are put into prompts
+COMPLETION_CACHE_TTL = 24 * 60 * 60
+COORDINATE_PRECISION = 3
+
+summary_cache = SQLiteCache('review_summaries', ttl=7 * 24 * 60 * 60, max_entries=5000)
+completion_cache = SQLiteCache('completions', ttl=COMPLETION_CACHE_TTL, max_entries=10000)
+
+# Prompts currently being answered, so identical concurrent prompts share one request
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+_completion_stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'saved_seconds': 0.0}
+_completion_stats_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+def format_coordinate(value, precision=COORDINATE_PRECISION):
+    """Round a coordinate for use in a prompt so nearby points share cached answers."""
+    return f"{round(float(value), precision):.{precision}f}"
+
+def _record_completion(outcome, saved_seconds=0.0):
+    with _completion_stats_lock:
+        _completion_stats[outcome] += 1
+        _completion_stats['saved_seconds'] += saved_seconds
+
+def get_completion_stats():
+    """
+    Return completion cache metrics for this process.
+
+    Returns:
+        dict: hits, misses and coalesced counts, hit_rate (hits and coalesced
+        calls over all calls) and saved_seconds, the upstream latency avoided.
+    """
+    with _completion_stats_lock:
+        stats = dict(_completion_stats)
+    total = stats['hits'] + stats['misses'] + stats['coalesced']
+    stats['hit_rate'] = (stats['hits'] + stats['coalesced']) / total if total else 0.0
+    return stats
+
+def _complete(prompt):
+    started = time.perf_counter()
+    response = fw_client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    return response.choices[0].message.content, time.perf_counter() - started
+
+def generate_answer(user_query, use_cache=True):
     """
     Generate an answer to the user query.
 
+    Answers are cached on disk by prompt and shared across sessions. Identical
+    prompts arriving while one is already in flight wait for that request
+    instead of sending their own.
+
     Args:
         user_query (str): The user's query string.
+        use_cache (bool): Set to False to always ask the model.
     """
-    # Use the `create_prompt` function above to create a chat prompt
     prompt = user_query
+    if not use_cache:
+        return _complete(prompt)[0]
 
-    # Use the `prompt` created above to populate the `content` field in the chat message
-    response = fw_client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}]
+    key = hashlib.sha256(f"{model}\n{prompt}".encode('utf-8')).hexdigest()
+    cached = completion_cache.get(key)
+    if cached is not None:
+        _record_completion('hits', cached['latency'])
+        return cached['answer']
+
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            # A leader may have cached the answer and left since the check above
+            cached = completion_cache.get(key)
+            if cached is None:
+                future = Future()
+                _in_flight[key] = future
+
+    if leader and cached is not None:
+        _record_completion('hits', cached['latency'])
+        return cached['answer']
+
+    if not leader:
+        answer, latency = future.result()
+        _record_completion('coalesced', latency)
+        return answer
+
+    try:
+        try:
+            answer, latency = _complete(prompt)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        # Waiting callers get the answer even if it cannot be cached
+        future.set_result((answer, latency))
+        _record_completion('misses')
+        try:
+            completion_cache.set(key, {'answer': answer, 'latency': latency})
+        except Exception:
+            logger.exception("Could not cache completion")
+        return answer
+    finally:
+        # Only leave once the answer is cached, so later callers find it there
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+
+def build_review_prompt(reviews):
+    return "Summarize the following reviews in one paragraph in 100 words max plain text:\n" + '\n'.join(
+        [f"{key}: {val}" for doc in reviews[:SUMMARY_REVIEW_COUNT] for key, val in doc.items()]
     )
-    # Print the final answer
-    return response.choices[0].message.content
\ No newline at end of file
+
+def review_summary_key(place_id, reviews):
+    content = [
+        {field: review.get(field) for field in SUMMARY_KEY_FIELDS}
+        for review in reviews[:SUMMARY_REVIEW_COUNT]
+    ]
+    payload = json.dumps([place_id, content], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def split_cached_summaries(stations):
+    """
+    Look up cached review summaries for a station table.
+
+    Stations without reviews are skipped.
+
+    Returns:
+        tuple: (summaries, pending) where summaries maps place ids to cached
+        text and pending lists (place_id, cache_key, prompt) for the misses.
+    """
+    summaries = {}
+    pending = []
+    if stations.empty:
+        return summaries, pending
+
+    seen = set()
+    for place_id, reviews in zip(stations['Place ID'], stations['Reviews']):
+        if not reviews or place_id in seen:
+            continue
+        seen.add(place_id)
+        key = review_summary_key(place_id, reviews)
+        summary = summary_cache.get(key)
+        if summary is not None:
+            summaries[place_id] = summary
+        else:
+            pending.append((place_id, key, build_review_prompt(reviews)))
+    return summaries, pending
+
+def iter_review_summaries(pending, max_workers=SUMMARY_MAX_WORKERS):
+    """
+    Generate the pending summaries concurrently, caching each one as it completes.
+
+    Args:
+        pending (list): (place_id, cache_key, prompt) tuples from `split_cached_summaries`.
+        max_workers (int): Maximum number of Fireworks requests in flight.
+
+    Yields:
+        tuple: (place_id, summary, error) in completion order.
+    """
+    # Summaries are cached by review content in summary_cache; the completion
+    # cache is skipped since its prompt key includes relative review dates
+    outcomes = iter_concurrently(generate_answer, [(prompt, False) for _, _, prompt in pending], max_workers)
+    for i, summary, error in outcomes:
+        place_id, key, _ = pending[i]
+        if error is None:
+            summary_cache.set(key, summary)
+        yield place_id, summary, error
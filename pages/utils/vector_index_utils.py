@@ -0,0 +1,84 @@
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Catalogs up to this size are searched exactly; larger ones use HNSW when hnswlib is installed
+EXACT_SEARCH_MAX_ITEMS = 20000
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 128
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class LocalVectorIndex:
+    """
+    In-process cosine similarity index over document embeddings.
+
+    Embeddings are held in one contiguous, L2-normalized float32 matrix.
+    Small catalogs are searched exactly with a single matrix-vector product;
+    large ones use an HNSW graph when hnswlib is available.
+
+    Args:
+        docs (list): Documents with an "embedding" field; every other field
+            is returned with search results.
+    """
+
+    def __init__(self, docs):
+        docs = [doc for doc in docs if doc.get("embedding") is not None and len(doc["embedding"])]
+        self.documents = [{k: v for k, v in doc.items() if k != "embedding"} for doc in docs]
+        if docs:
+            matrix = np.asarray([doc["embedding"] for doc in docs], dtype=np.float32)
+        else:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        self.embeddings = np.ascontiguousarray(_normalize(matrix)) if len(matrix) else matrix
+
+        self.hnsw = None
+        if hnswlib is not None and len(self.documents) > EXACT_SEARCH_MAX_ITEMS:
+            self.hnsw = hnswlib.Index(space="cosine", dim=self.embeddings.shape[1])
+            self.hnsw.init_index(
+                max_elements=len(self.documents), M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION
+            )
+            self.hnsw.add_items(self.embeddings, np.arange(len(self.documents)))
+            self.hnsw.set_ef(HNSW_EF_SEARCH)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def search(self, query_embedding, limit=4):
+        """
+        Return the `limit` documents most similar to the query.
+
+        Scores follow Atlas $vectorSearch for cosine similarity, (1 + cosine) / 2,
+        so results are interchangeable with the aggregation pipeline output.
+
+        Args:
+            query_embedding (array-like): Query vector.
+            limit (int): Number of documents to return.
+
+        Returns:
+            list: Documents with a "score" field, best match first.
+        """
+        if not self.documents:
+            return []
+
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        limit = min(limit, len(self.documents))
+
+        if self.hnsw is not None:
+            labels, distances = self.hnsw.knn_query(query, k=limit)
+            indexes, similarities = labels[0], 1.0 - distances[0]
+        else:
+            similarities = self.embeddings @ query
+            indexes = np.argpartition(-similarities, limit - 1)[:limit]
+            indexes = indexes[np.argsort(-similarities[indexes])]
+            similarities = similarities[indexes]
+
+        return [
+            dict(self.documents[i], score=float((1.0 + similarity) / 2.0))
+            for i, similarity in zip(indexes, similarities)
+        ]